@@ -11,4 +11,10 @@ except ImportError:
     raise ImportError('NumPy does not seem to be installed. Please see the user guide.')
 
 from .network import *
-from .operations import *
\ No newline at end of file
+from .operations import *
+from .junctiontree import *
+from .compiled import *
+from .sampling import *
+from .learning import *
+from .xdsl import *
+from .storage import *
\ No newline at end of file
@@ -0,0 +1,313 @@
+#!/usr/bin/python -tt
+# -*- coding: utf-8 -*-
+
+import sys
+import numpy as np
+from multiprocessing import shared_memory
+from .operations import *
+from .junctiontree import *
+
+class CompiledNetwork(object):
+  """Compiled network
+
+  Array-backed representation of a Bayesian network. The nodes are numbered
+  by their position 0,...,n-1 in the network, and the variable of node i in
+  the factors is i+1. The parents are stored in compressed sparse row (CSR)
+  form and the probabilities of all nodes in one contiguous array. The
+  conditional probability table of a node is an n-d view into this array,
+  with one axis for each parent followed by the axis of the node itself
+  (GeNIe order).
+
+  :Attributes:
+    - names (list): Names of the nodes
+    - index (dict): Position of each node by name
+    - card (array): Number of outcomes of each node
+    - indptr (array): The parents of node i are indices[indptr[i]:indptr[i+1]]
+    - indices (array): Positions of the parents
+    - offsets (array): The probabilities of node i are values[offsets[i]:offsets[i+1]]
+    - values (array): Probabilities of all nodes
+    - order (array): Topological order of the nodes
+
+  The arrays can be placed in shared memory, see share, so that the worker
+  processes of a pool use one copy of the network.
+  """
+
+  def __init__(self, names, card, indptr, indices, offsets, values):
+    self.names = list(names)
+    self.index = dict((name, i) for i, name in enumerate(self.names))
+    self.card = np.asarray(card, dtype=np.int64)
+    self.indptr = np.asarray(indptr, dtype=np.int64)
+    self.indices = np.asarray(indices, dtype=np.int64)
+    self.offsets = np.asarray(offsets, dtype=np.int64)
+    self.values = values
+    self.order = TopologicalOrder(self.indptr, self.indices)
+    self.factorValues = None
+    self.factors = None
+    self.junctiontree = None
+    self.memory = []
+
+  def __len__(self):
+    return len(self.names)
+
+  def getParents(self, i):
+    """Returns the positions of the parents of node i"""
+    return self.indices[self.indptr[i]:self.indptr[i+1]]
+
+  def getCpt(self, i):
+    """Returns the conditional probability table of node i
+
+    :Returns:
+      - cpt (array): n-d view with one axis per parent and the axis of the node as last axis
+    """
+    shape = tuple(self.card[self.getParents(i)])+(self.card[i],)
+    return self.values[self.offsets[i]:self.offsets[i+1]].reshape(shape)
+
+  def getFactors(self):
+    """Returns the factors of the network
+
+    :Returns:
+      - factors (list): One Factor for the conditional probability table of each node
+    """
+    if self.factors is None:
+      values = self.getFactorValues()
+      self.factors = []
+      for i in range(len(self.names)):
+        parents = self.getParents(i)
+        factor = Factor()
+        factor.var = np.append([i], parents)+1
+        factor.card = np.array(self.card[factor.var-1], dtype='i')
+        factor.val = values[self.offsets[i]:self.offsets[i+1]]
+        factor.name = self.names[i]
+        self.factors.append(factor)
+    return self.factors
+
+  def getFactorValues(self):
+    """Returns the probabilities of all nodes in the order of the factors
+
+    The table of node i is values[offsets[i]:offsets[i+1]] with the node as
+    first variable followed by its parents, the first variable changing
+    fastest.
+
+    :Returns:
+      - values (array): Probabilities of all nodes
+    """
+    if self.factorValues is None:
+      values = np.empty(len(self.values))
+      for i in range(len(self.names)):
+        k = len(self.getParents(i))
+        cpt = np.transpose(self.getCpt(i), [k]+list(range(k)))
+        values[self.offsets[i]:self.offsets[i+1]] = np.ravel(cpt, order='F')
+      self.factorValues = values
+    return self.factorValues
+
+  def share(self):
+    """Place the arrays of the network in shared memory
+
+    The index arrays are copied into one shared memory segment and the
+    probabilities, in the order of the nodes and of the factors, into a
+    second one. The network itself uses the shared arrays afterwards. The
+    segments exist until SharedNetwork.unlink is called.
+
+    :Returns:
+      - handle (SharedNetwork): Picklable handle by which other processes attach to the network
+    """
+    index = [self.card, self.indptr, self.indices, self.offsets]
+    values = [self.values, self.getFactorValues()]
+    memory = []
+    for arrays in (index, values):
+      segment = shared_memory.SharedMemory(create=True, size=max(1, sum(a.nbytes for a in arrays)))
+      shared = np.ndarray(sum(len(a) for a in arrays), dtype=arrays[0].dtype, buffer=segment.buf)
+      shared[:] = np.concatenate(arrays)
+      memory.append(segment)
+    handle = SharedNetwork(self.names, memory[0].name, [len(a) for a in index], memory[1].name, [len(a) for a in values])
+    self.card, self.indptr, self.indices, self.offsets, self.values, self.factorValues = handle.split(memory)
+    self.factors = None
+    self.junctiontree = None
+    self.memory = memory
+    return handle
+
+  def getEvidence(self, evidence):
+    """Converts evidence given by names into the evidence of the factors
+
+    :Args:
+      - evidence (dict): Number of the observed stage, starting with 1, for the names of the observed nodes
+
+    :Returns:
+      - E (list): List of variable/value pairs
+    """
+    E = []
+    if evidence is not None:
+      for name, value in evidence.items():
+        E.append([self.index[name]+1, value])
+    return E
+
+  def query(self, names, evidence=None):
+    """Compute the marginal over a set of nodes by variable elimination
+
+    :Args:
+      - names (list): Names of the nodes in the marginal
+      - evidence (dict): Observed stages, see getEvidence
+
+    :Returns:
+      - marginal (Factor): Renormalized factor over the nodes
+    """
+    V = [self.index[name]+1 for name in names]
+    return VariableElimination(V, self.getFactors(), self.getEvidence(evidence))
+
+  def computeBeliefs(self, evidence=None):
+    """Compute the beliefs of all nodes in the junction tree
+
+    The junction tree is built by the first call and reused afterwards.
+
+    :Args:
+      - evidence (dict): Observed stages, see getEvidence
+
+    :Returns:
+      - beliefs (list): Beliefs of the nodes in the order of the network
+    """
+    if self.junctiontree is None:
+      self.junctiontree = JunctionTree(self.getFactors())
+    self.junctiontree.calibrate(self.getEvidence(evidence))
+    return [self.junctiontree.getMarginal(i+1).val for i in range(len(self.names))]
+
+
+class SharedNetwork(object):
+  """Handle of a compiled network in shared memory
+
+  The handle only holds the names of the nodes and of the shared memory
+  segments. It is sent to the worker processes, which attach to the network
+  without copying its arrays.
+
+  :Example:
+     >>>
+     handle = network.compileArrays().share()
+     with ProcessPoolExecutor(initializer=init, initargs=(handle,)) as pool:
+       ...
+     handle.unlink()
+  """
+
+  def __init__(self, names, index, indexSizes, values, valuesSizes):
+    self.names = list(names)
+    self.index = index
+    self.indexSizes = indexSizes
+    self.values = values
+    self.valuesSizes = valuesSizes
+
+  def split(self, memory):
+    """Returns the arrays of the network as views into the shared memory segments"""
+    arrays = []
+    for segment, sizes, dtype in zip(memory, (self.indexSizes, self.valuesSizes), (np.int64, np.float64)):
+      shared = np.ndarray(sum(sizes), dtype=dtype, buffer=segment.buf)
+      shared.flags.writeable = False
+      start = 0
+      for size in sizes:
+        arrays.append(shared[start:start+size])
+        start += size
+    return arrays
+
+  def attach(self):
+    """Attach to the network in shared memory
+
+    :Returns:
+      - compiled (CompiledNetwork): Network whose arrays are views into the shared memory
+    """
+    memory = []
+    for name in (self.index, self.values):
+      if sys.version_info >= (3, 13):
+        segment = shared_memory.SharedMemory(name=name, track=False)
+      else:
+        # The segments belong to the process which shared the network, so
+        # this process must not remove them at its exit
+        segment = shared_memory.SharedMemory(name=name)
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(segment._name, 'shared_memory')
+      memory.append(segment)
+    card, indptr, indices, offsets, values, factorValues = self.split(memory)
+    compiled = CompiledNetwork(self.names, card, indptr, indices, offsets, values)
+    compiled.factorValues = factorValues
+    compiled.memory = memory
+    return compiled
+
+  def unlink(self):
+    """Remove the shared memory segments, the attached networks can't be used afterwards"""
+    for name in (self.index, self.values):
+      try:
+        shared_memory.SharedMemory(name=name).unlink()
+      except FileNotFoundError:
+        pass
+
+
+def CompileNetwork(network, values=None, factorValues=None):
+  """Compile a network into its array-backed representation
+
+  The probabilities of the nodes are copied into one array unless the array
+  is given, e.g. as memory-mapped table of LoadNetwork.
+
+  :Args:
+    - network (Network): Bayesian network
+    - values (array): Probabilities of all nodes in the layout of CompiledNetwork.values, which are used without copying
+    - factorValues (array): Probabilities of all nodes in the order of the factors, see CompiledNetwork.getFactorValues
+
+  :Returns:
+    - compiled (CompiledNetwork): Array-backed representation of the network
+
+  :Raises:
+    - ValueError: The given probabilities don't match the tables of the nodes
+  """
+  names = [str(node) for node in network.nodes]
+  position = dict((node.getIdNum(), i) for i, node in enumerate(network.nodes))
+  card = np.array([node.getSize() for node in network.nodes], dtype=np.int64)
+
+  indptr = np.zeros(len(names)+1, dtype=np.int64)
+  indices = []
+  for i, node in enumerate(network.nodes):
+    parents = [position[idNum] for idNum in node.getArcConnectionId()]
+    indices.extend(parents)
+    indptr[i+1] = indptr[i]+len(parents)
+  indices = np.array(indices, dtype=np.int64)
+
+  offsets = np.zeros(len(names)+1, dtype=np.int64)
+  for i in range(len(names)):
+    offsets[i+1] = offsets[i]+card[i]*np.prod(card[indices[indptr[i]:indptr[i+1]]])
+  for array in (values, factorValues):
+    if array is not None and len(array) != offsets[-1]:
+      raise ValueError('Error: The network has '+str(offsets[-1])+' probabilities, not '+str(len(array)))
+  if values is None:
+    values = np.empty(offsets[-1])
+    for i, node in enumerate(network.nodes):
+      values[offsets[i]:offsets[i+1]] = node.getProbabilities()
+  compiled = CompiledNetwork(names, card, indptr, indices, offsets, values)
+  compiled.factorValues = factorValues
+  return compiled
+
+
+def TopologicalOrder(indptr, indices):
+  """Topological order of a directed acyclic graph in CSR form
+
+  :Args:
+    - indptr (array): The parents of node i are indices[indptr[i]:indptr[i+1]]
+    - indices (array): Positions of the parents
+
+  :Returns:
+    - order (array): Positions of the nodes, every node comes after its parents
+  """
+  n = len(indptr)-1
+  children = np.repeat(np.arange(n), np.diff(indptr))
+  sort = np.argsort(indices, kind='stable')
+  childptr = np.zeros(n+1, dtype=np.int64)
+  np.cumsum(np.bincount(indices, minlength=n), out=childptr[1:])
+  children = children[sort]
+
+  missing = np.diff(indptr).copy()
+  stack = list(np.nonzero(missing == 0)[0])
+  order = []
+  while stack != []:
+    i = stack.pop()
+    order.append(i)
+    for j in children[childptr[i]:childptr[i+1]]:
+      missing[j] -= 1
+      if missing[j] == 0:
+        stack.append(j)
+  if len(order) != n:
+    raise ValueError('Error: The network contains a cycle')
+  return np.array(order, dtype=np.int64)
@@ -0,0 +1,344 @@
+#!/usr/bin/python -tt
+# -*- coding: utf-8 -*-
+
+import numpy as np
+from itertools import combinations
+from .operations import *
+
+class JunctionTree(object):
+  """Junction tree
+
+  The junction (clique) tree is compiled once from the factors of a network.
+  The factors are multiplied into the clique potentials, and the tree is
+  calibrated by two-pass (collect and distribute) message passing. After the
+  calibration the marginals of all variables are read from the clique
+  beliefs, i.e. all marginals are computed in one sweep.
+
+  The evidence is entered by reducing the factors, i.e. the observed
+  variables are removed from the clique potentials and the messages. The
+  reduced clique potentials are cached. If the evidence changes, only the
+  potentials of the cliques which contain an observed factor are recomputed.
+  The messages are kept between the calibrations. A changed potential only
+  invalidates the messages which point away from its clique, so that a
+  changed evidence is propagated from the affected cliques only.
+
+  :Attributes:
+    - cliques (list): List of cliques, each a list of variables
+    - edges (list): List of edges [i,j] between the cliques i and j
+    - card (dict): Cardinality of each variable
+
+  :Args:
+    - F (list): Factors of the network
+    - heuristic (str): Heuristic of the elimination order which triangulates the network, see EliminationOrder
+    - limit (int): Maximal number of bytes of a clique potential. A FactorSizeError is raised before any potential is computed if a clique is larger.
+  """
+
+  def __init__(self, F, heuristic='minfill', limit=None):
+    self.card = {}
+    for factor in F:
+      self.card.update(zip(factor.var, factor.card))
+
+    self.cliques = triangulate([factor.var for factor in F], self.card, heuristic)
+    self.maxCliqueSize = 0.0
+    for clique in self.cliques:
+      self.maxCliqueSize = max(self.maxCliqueSize, np.prod([self.card[v] for v in clique], dtype=float))
+    CheckFactorSize(self.maxCliqueSize*8, limit)
+
+    # Connect the cliques by a maximum spanning tree over the separator size
+    cliquesOf = {}
+    for i, clique in enumerate(self.cliques):
+      for var in clique:
+        cliquesOf.setdefault(var, []).append(i)
+    candidates = set()
+    for members in cliquesOf.values():
+      for i, j in combinations(members, 2):
+        candidates.add((i, j))
+    candidates = sorted(candidates, key=lambda e: -len(set(self.cliques[e[0]]) & set(self.cliques[e[1]])))
+
+    root = list(range(len(self.cliques)))
+    def find(i):
+      while root[i] != i:
+        root[i] = root[root[i]]
+        i = root[i]
+      return i
+
+    self.edges = []
+    self.neighbors = [[] for clique in self.cliques]
+    for i, j in candidates:
+      ri, rj = find(i), find(j)
+      if ri != rj:
+        root[ri] = rj
+        self.edges.append([i, j])
+        self.neighbors[i].append(j)
+        self.neighbors[j].append(i)
+
+    # Assign every factor to the smallest clique which contains its scope
+    self.factors = [[] for clique in self.cliques]
+    for factor in F:
+      scope = set(factor.var)
+      home = None
+      for i in cliquesOf[factor.var[0]]:
+        if scope <= set(self.cliques[i]):
+          if home is None or len(self.cliques[i]) < len(self.cliques[home]):
+            home = i
+      self.factors[home].append(factor)
+
+    # Smallest clique of each variable to read the marginal from
+    self.home = {}
+    for var, members in cliquesOf.items():
+      self.home[var] = min(members, key=lambda i: np.prod([self.card[v] for v in self.cliques[i]], dtype=float))
+
+    self.evidence = {}
+    self.likelihoods = {}
+    self.potentials = [None]*len(self.cliques)
+    for i in range(len(self.cliques)):
+      self.potentials[i] = self.computePotential(i)
+    self.messages = {}
+    self.beliefs = [None]*len(self.cliques)
+    self.valid = [False]*len(self.cliques)
+    self.marginals = {}
+
+  def computePotential(self, i):
+    """Multiply the factors of clique i and enter the evidence
+
+    :Args:
+      - i (int): Index of the clique
+
+    :Returns:
+      - potential (Factor): Clique potential or ``None`` if no factor is assigned to the clique
+    """
+    E = [[var, val] for var, val in self.evidence.items() if var in self.cliques[i]]
+    factors = FactorReduction(self.getFactors(i), E)
+    potential = _product([factor for factor in factors if len(factor.var) != 0])
+    if potential is not None:
+      potential = AutoFactor(potential)
+    return potential
+
+  def getFactors(self, i):
+    """Returns the factors of clique i
+
+    :Args:
+      - i (int): Index of the clique
+
+    :Returns:
+      - factors (list): Factors assigned to the clique and the likelihoods of the variables whose marginal is read from the clique
+    """
+    factors = list(self.factors[i])
+    for var, likelihood in self.likelihoods.items():
+      if self.home[var] == i:
+        factors.append(likelihood)
+    return factors
+
+  def setEvidence(self, E):
+    """Enter evidence into the junction tree
+
+    Only the potentials of the cliques which contain a factor over a variable
+    whose evidence has changed are recomputed.
+
+    :Args:
+      - E (tuple): E is an N-by-2 matrix, each row being a variable/value pair. Rows with a value of 0 are ignored.
+    """
+    evidence = {}
+    for var, val in E:
+      if val != 0 and var in self.card:
+        evidence[var] = val
+    changed = set(evidence.items()) ^ set(self.evidence.items())
+    changed = set(var for var, val in changed)
+    self.evidence = evidence
+    for var in changed:
+      self.marginals.pop(var, None)
+    self.update(changed)
+
+  def setLikelihoods(self, L):
+    """Enter likelihoods (soft evidence) into the junction tree
+
+    A likelihood is a factor over a single variable which is multiplied into
+    the clique from which the marginal of the variable is read. Likelihoods
+    with a batch axis calibrate the tree for a batch of cases at once.
+
+    :Args:
+      - L (dict): Likelihood factor for each variable, an empty dict removes all likelihoods
+    """
+    changed = set(L) | set(self.likelihoods)
+    self.likelihoods = dict(L)
+    self.update(changed)
+
+  def update(self, changed):
+    """Recompute the potentials of the cliques with a factor over a changed variable
+
+    :Args:
+      - changed (set): Variables whose evidence or likelihood has changed
+    """
+    homes = set(self.home[var] for var in changed if var in self.home)
+    for i in range(len(self.cliques)):
+      dirty = i in homes
+      for factor in self.factors[i]:
+        if dirty:
+          break
+        dirty = len(changed.intersection(factor.var)) != 0
+      if dirty:
+        self.potentials[i] = self.computePotential(i)
+        self.invalidate(i)
+
+  def invalidate(self, r):
+    """Invalidate all results which depend on the potential of clique r
+
+    These are the messages pointing away from clique r, and the beliefs and
+    marginals of all cliques in the same tree.
+
+    :Args:
+      - r (int): Index of the clique
+    """
+    stack = [(r, None)]
+    while stack != []:
+      i, parent = stack.pop()
+      self.valid[i] = False
+      for var in self.cliques[i]:
+        self.marginals.pop(var, None)
+      for j in self.neighbors[i]:
+        if j != parent:
+          self.messages.pop((i, j), None)
+          stack.append((j, i))
+
+  def calibrate(self, E=None):
+    """Calibrate the junction tree by two-pass message passing
+
+    :Args:
+      - E (tuple): Evidence, see setEvidence. If no evidence is given the current evidence is kept.
+    """
+    if E is not None:
+      self.setEvidence(E)
+    visited = [False]*len(self.cliques)
+    for r in range(len(self.cliques)):
+      if visited[r] or self.valid[r]:
+        continue
+      # Order the cliques of the tree from the root r to the leaves
+      order = [(r, None)]
+      visited[r] = True
+      for i, parent in order:
+        for j in self.neighbors[i]:
+          if not visited[j]:
+            visited[j] = True
+            order.append((j, i))
+      # Collect evidence towards the root, valid messages are kept
+      for i, parent in reversed(order):
+        if parent is not None and (i, parent) not in self.messages:
+          self.messages[(i, parent)] = self.computeMessage(i, parent)
+      # Distribute evidence from the root
+      for i, parent in order:
+        if parent is not None and (parent, i) not in self.messages:
+          self.messages[(parent, i)] = self.computeMessage(parent, i)
+      for i, parent in order:
+        if not self.valid[i]:
+          incoming = [self.messages[(j, i)] for j in self.neighbors[i]]
+          self.beliefs[i] = _product([self.potentials[i]]+incoming)
+          self.valid[i] = True
+
+  def computeMessage(self, i, j):
+    """Compute the message from clique i to clique j
+
+    :Returns:
+      - message (Factor): Message over the separator or ``None`` for a constant message
+    """
+    incoming = [self.messages[(k, i)] for k in self.neighbors[i] if k != j]
+    psi = _product([self.potentials[i]]+incoming)
+    if psi is None:
+      return None
+    V = [var for var in psi.var if var not in self.cliques[j]]
+    if len(V) == len(psi.var):
+      return None
+    if V == []:
+      return psi
+    return AutoFactor(FactorMarginalization(psi, V))
+
+  def getMarginal(self, var):
+    """Returns the marginal of a variable from the calibrated tree
+
+    :Args:
+      - var (int): Variable
+
+    :Returns:
+      - M (Factor): Renormalized factor over the variable
+    """
+    if var not in self.marginals:
+      self.marginals[var] = self.computeMarginal(var)
+    return self.marginals[var]
+
+  def computeMarginal(self, var):
+    """Compute the marginal of a variable from the calibrated tree
+
+    :Args:
+      - var (int): Variable
+
+    :Returns:
+      - M (Factor): Renormalized factor over the variable
+    """
+    if var in self.evidence:
+      M = Factor()
+      M.input([var], [self.card[var]], np.zeros(self.card[var]))
+      M.val[self.evidence[var]-1] = 1
+      return M
+    belief = self.beliefs[self.home[var]]
+    if belief is None or var not in belief.var:
+      M = Factor()
+      M.input([var], [self.card[var]], np.ones(self.card[var]))
+    else:
+      V = [v for v in belief.var if v != var]
+      if V == []:
+        belief = ToDense(belief)
+        M = Factor()
+        M.input(belief.var, belief.card, belief.val)
+      else:
+        M = ToDense(FactorMarginalization(belief, V))
+    return RenormalizeFactor(M)
+
+
+def _product(F):
+  """Multiply a list of factors, ``None`` entries are treated as unit factors
+
+  :Args:
+    - F (list): List of factors
+
+  :Returns:
+    - P (Factor): Product of the factors or ``None`` if the list contains no factor
+  """
+  P = None
+  for factor in F:
+    if factor is None:
+      continue
+    if P is None:
+      P = factor
+    else:
+      P = FactorProduct(P, factor)
+  return P
+
+
+def triangulate(scopes, card, heuristic='minfill'):
+  """Triangulate the interaction graph of a set of factors
+
+  :Args:
+    - scopes (list): List of factor scopes, each a list of variables
+    - card (dict): Cardinality of each variable
+    - heuristic (str): Heuristic of the elimination order, see EliminationOrder
+
+  :Returns:
+    - cliques (list): Maximal cliques of the triangulated graph
+  """
+  order = EliminationOrder(scopes, card, heuristic)
+  adjacency = InteractionGraph(scopes)
+  cliques = []
+  cliquesOf = {}
+  for z in order:
+    nb = adjacency.pop(z)
+    for a, b in combinations(nb, 2):
+      adjacency[a].add(b)
+      adjacency[b].add(a)
+    for a in nb:
+      adjacency[a].discard(z)
+    # An earlier clique which contains the new clique has to contain z
+    clique = nb | set([z])
+    if not any(clique <= cliques[i] for i in cliquesOf.get(z, [])):
+      for var in clique:
+        cliquesOf.setdefault(var, []).append(len(cliques))
+      cliques.append(clique)
+  return [sorted(clique) for clique in cliques]
@@ -0,0 +1,97 @@
+#!/usr/bin/python -tt
+# -*- coding: utf-8 -*-
+
+import numpy as np
+from .compiled import *
+from .sampling import *
+
+def DataBlocks(data, n, chunk_size=65536):
+  """Split data into blocks of samples
+
+  :Args:
+    - data (array or iterable): Array with one sample per row, e.g. a memory-mapped .npy file, or an iterable of such arrays
+    - n (int): Number of nodes, i.e. of columns
+    - chunk_size (int): Largest number of samples of a block
+
+  :Returns:
+    - blocks (generator): n-by-N arrays with the states of the nodes in N samples
+
+  :Raises:
+    - ValueError: The data isn't an integer array with one column per node
+  """
+  if isinstance(data, np.ndarray):
+    data = [data]
+  for chunk in data:
+    chunk = np.asarray(chunk)
+    if chunk.ndim != 2 or chunk.shape[1] != n:
+      raise ValueError('Error: The data has to have one column for each of the '+str(n)+' nodes')
+    if not np.issubdtype(chunk.dtype, np.integer):
+      raise ValueError('Error: The data has to be an array of integer states')
+    for start in range(0, chunk.shape[0], chunk_size):
+      yield np.ascontiguousarray(chunk[start:start+chunk_size].T)
+
+
+def FamilyCounts(compiled, data, chunk_size=None):
+  """Count the configurations of the family of each node in data
+
+  The family of a node is the node and its parents. For each sample, the
+  configuration of the family of node i is flattened into the index of the
+  entry of its table in compiled.values, i.e. offsets[i]+row*card[i]+state
+  with the row of the parents of ParentRows. The counts of all nodes are
+  taken by one np.bincount per block of samples. The data is read block by
+  block, i.e. it can be larger than the memory.
+
+  :Args:
+    - compiled (CompiledNetwork): Compiled network
+    - data (array or iterable): Array with one sample per row and one column per node in the order of the network, the states start with 0, or an iterable of such arrays, e.g. the chunks of SampleChunks
+    - chunk_size (int): Number of samples which are counted at once, by default such that the indices of a block have at most sampleBlockSize entries
+
+  :Returns:
+    - counts (array): Number of samples for each entry of compiled.values
+
+  :Raises:
+    - ValueError: The data isn't an integer array with one column per node or contains a state which the node hasn't
+  """
+  n = len(compiled)
+  if chunk_size is None:
+    chunk_size = max(1, sampleBlockSize // max(n, 1))
+  card = compiled.card
+  counts = np.zeros(compiled.offsets[-1], dtype=np.int64)
+  for states in DataBlocks(data, n, chunk_size):
+    if np.any(states < 0) or np.any(states >= card[:,None]):
+      raise ValueError('Error: The data contains a state which is not an outcome of its node')
+    index = np.empty(states.shape, dtype=np.intp)
+    for i in range(n):
+      index[i] = compiled.offsets[i]+ParentRows(card, compiled.getParents(i), states)*card[i]+states[i]
+    counts += np.bincount(np.ravel(index), minlength=len(counts))
+  return counts
+
+
+def EstimateProbabilities(compiled, counts, prior=None):
+  """Estimate the conditional probability tables from family counts
+
+  The estimate is the maximum likelihood estimate or, if a Dirichlet prior
+  is given, the maximum a posteriori estimate, i.e. the counts plus the
+  pseudo counts of the prior normalized for each configuration of the
+  parents. Configurations without counts and pseudo counts keep their
+  probabilities.
+
+  :Args:
+    - compiled (CompiledNetwork): Compiled network
+    - counts (array): Counts for each entry of compiled.values, see FamilyCounts
+    - prior (float or array): Pseudo count of each entry of the tables, or an array of pseudo counts in the layout of compiled.values
+
+  :Returns:
+    - values (array): Estimated probabilities in the layout of compiled.values
+  """
+  counts = np.asarray(counts, dtype=float)
+  if prior is not None:
+    counts = counts+prior
+  values = np.array(compiled.values, dtype=float)
+  for i in range(len(compiled)):
+    table = counts[compiled.offsets[i]:compiled.offsets[i+1]].reshape(-1, compiled.card[i])
+    total = np.sum(table, axis=1)
+    seen = total > 0
+    estimate = values[compiled.offsets[i]:compiled.offsets[i+1]].reshape(-1, compiled.card[i])
+    estimate[seen] = table[seen]/total[seen][:,None]
+  return values
@@ -2,7 +2,16 @@
 # -*- coding: utf-8 -*-
 
 import sys
+import gzip
+import heapq
+import threading
+from io import StringIO
+from collections import OrderedDict
 from .operations import *
+from .junctiontree import *
+from .compiled import *
+from .sampling import *
+from .learning import *
 from operator import mul
 
 class Network(object):
@@ -15,19 +24,59 @@ class Network(object):
   def __init__(self, name):
     self.name = repEmptySpace(name)
     self.nodes = []
+    self.index = {}
+    self.nextIdNum = 1
+    self.lock = threading.Lock()
+    self.arrays = None
     self.evidence = []
     self.marginal = None
+    self.errors = None
+    self.diagnostics = None
+    self.junctiontree = None
+    self.compiled = False
+    self.heuristic = 'minfill'
+    self.memoryLimit = None
+    self.fallback = None
+    self.cache = OrderedDict()
+    self.cacheSize = 0
+    self.cacheHits = 0
+    self.cacheMisses = 0
 
   def __str__(self):
     return self.name
 
+  def __getstate__(self):
+    # The lock of addNode can't be pickled or copied, a copy gets a new one
+    state = self.__dict__.copy()
+    del state['lock']
+    return state
+
+  def __setstate__(self, state):
+    self.__dict__.update(state)
+    self.lock = threading.Lock()
+
   def addNode(self, node):
     """Add one node to the network
 
+    The node gets the next number of the network, i.e. the numbers of the
+    nodes only depend on the order in which they are added to their network.
+    Nodes can be added to a network from several threads.
+
     :Args:
       - node (Node): Node element
+
+    :Raises:
+      - ValueError: The node already belongs to a network
     """
-    self.nodes.append(node)
+    with self.lock:
+      if node.network is not None:
+        raise ValueError('Error: Node '+str(node)+' already belongs to the network '+str(node.network))
+      node.setIdNum(self.nextIdNum)
+      self.nextIdNum += 1
+      self.index[str(node)] = len(self.nodes)
+      self.nodes.append(node)
+      node.network = self
+      self.modified()
 
   def addNodes(self,nodes):
     """Add a list of nodes to the network
@@ -43,19 +92,73 @@ class Network(object):
 
     :Args:
       - name (str): Name of the Node
-      - value (int): Number of stage which is observed. Starting with 0.
+      - value (int): Number of stage which is observed. Starting with 1. The name of the outcome can be used as well.
     """
-    for node in self.nodes:
-      if name == str(node):
-        var = node.getIdNum()
-        outcomes = node.getOutcomes()
-        if type(value) is str:
-          for outcome in outcomes:
-            if value == outcome:
-              val = j+1
-        elif type(value) is int:
-          val = value
-        self.evidence.append([var,val])    
+    node = self.getNode(name)
+    if node is not None:
+      var = node.getIdNum()
+      outcomes = node.getOutcomes()
+      if type(value) is str:
+        val = outcomes.index(repEmptySpace(value))+1
+      else:
+        val = int(value)
+      self.evidence.append([var,val])
+
+  def getNode(self,name):
+    """Returns a node of the network
+
+    :Args:
+      - name (str): Name of the Node
+
+    :Returns:
+      - node (Node): The node or None if the network has no node with this name
+    """
+    if name in self.index:
+      return self.nodes[self.index[name]]
+    return None
+
+  def addEvidence(self,name,value):
+    """Add evidence for a Node element and update the beliefs
+
+    The beliefs are updated incrementally in the junction tree of the
+    network, which is compiled if necessary. The messages which do not
+    depend on the observed node are reused, i.e. the evidence is only
+    propagated from the cliques which contain the node. An earlier evidence
+    for the node is replaced.
+
+    :Args:
+      - name (str): Name of the Node
+      - value (int): Number of stage which is observed. Starting with 1.
+    """
+    self.removeEvidence(name)
+    self.setEvidence(name,value)
+    if not self.compiled:
+      self.compile()
+    self.computeBeliefs()
+
+  def retractEvidence(self,name):
+    """Retract the evidence for a Node element and update the beliefs
+
+    The beliefs are updated incrementally like in addEvidence.
+
+    :Args:
+      - name (str): Name of the Node
+    """
+    self.removeEvidence(name)
+    if not self.compiled:
+      self.compile()
+    self.computeBeliefs()
+
+  def removeEvidence(self,name):
+    """Remove the evidence for a Node element without computing the beliefs
+
+    :Args:
+      - name (str): Name of the Node
+    """
+    node = self.getNode(name)
+    if node is not None:
+      var = node.getIdNum()
+      self.evidence = [[v,x] for v,x in self.evidence if v != var]
 
   def getEvidence(self):
     """Return information about the evidence
@@ -74,50 +177,497 @@ class Network(object):
     self.evidence = []
     self.marginal = None
     for node in self.nodes:
-      node.setBeliefs(node.getProbabilities())
       node.setCard([])
-      var = np.append(node.getVar(),node.getArcConnectionId()).tolist()
-      node.setVar(var)
+      if isinstance(node, NoisyMaxNode):
+        # The table of a noisy-MAX node is only used in factorised form
+        node.setBeliefs(None)
+        continue
+      node.setBeliefs(node.getProbabilities())
       node.setVal(node.transformProbabilities())
 
-  def computeBeliefs(self):
-    """Compute beliefs of the network"""
-    order = []
+  def getFactors(self):
+    """Returns the factors of the network
+
+    :Returns:
+      - factors (list): A list with the factors of each node, i.e. one Factor for the conditional probability table of a Node and the factorised table of a NoisyMaxNode
+    """
     factors = []
-    marginal = []
+    for node in self.nodes:
+      factors.extend(node.getFactors())
+    return factors
+
+  def query(self,vars):
+    """Compute the marginal over a set of nodes given the evidence
+
+    The marginal is computed by variable elimination, i.e. only factors of
+    the size of the elimination width are built. The memory limit of
+    setMemoryLimit applies. If it is exceeded and a fallback is set, the
+    marginal of a single node is taken from the beliefs of the fallback; the
+    fallback only computes the beliefs of single nodes, i.e. a joint
+    marginal still raises the FactorSizeError.
 
+    :Args:
+      - vars (list): Names of the nodes in the marginal
+
+    :Returns:
+      - marginal (Factor): Renormalized factor over the nodes
+
+    :Raises:
+      - FactorSizeError: A factor would exceed the memory limit and no fallback can compute the marginal
+    """
+    V = [self.getNode(name).getIdNum() for name in vars]
+    try:
+      return VariableElimination(V, self.getFactors(), self.getEvidence(), limit=self.memoryLimit)
+    except FactorSizeError:
+      if self.fallback is None or len(V) != 1:
+        raise
+      self.marginal = []
+      self.fallback(self)
+      node = self.getNode(vars[0])
+      marginal = Factor()
+      marginal.input(V, [len(node.getOutcomes())], np.asarray(node.beliefs, dtype=float))
+      return marginal
+
+  def getScopes(self):
+    """Returns the scopes of the conditional probability tables
+
+    :Returns:
+      - scopes, card (tuple): scopes is a list with the number of each node followed by the numbers of its parents\n
+        card is a dict with the cardinality of each node
+    """
+    scopes = []
+    card = {}
     for node in self.nodes:
-      factor = Factor()
-      order.append(node.getIdNum())
-      node.setVal(node.transformProbabilities())
-      var, card, val = node.getInput()
-      factor.input(var,card,val)
-      factors.append(factor)
+      scopes.extend(node.getScopes())
+      card[node.getIdNum()] = node.getSize()
+      if isinstance(node, NoisyMaxNode):
+        card[node.getAuxIdNum()] = node.getSize()
+    return scopes, card
 
-    evidence = self.getEvidence()
+  def getVariableNames(self):
+    """Returns the names of the variables of the factors
+
+    :Returns:
+      - names (dict): Name of each variable, the auxiliary variable of a NoisyMaxNode is named by the name of the node followed by a prime
+    """
+    names = {}
+    for node in self.nodes:
+      names[node.getIdNum()] = str(node)
+      if isinstance(node, NoisyMaxNode):
+        names[node.getAuxIdNum()] = str(node)+"'"
+    return names
+
+  def getEliminationOrder(self,heuristic='minfill',vars=None):
+    """Returns an elimination order for the nodes of the network
+
+    The order is computed on the moral graph of the network, which is given by
+    the parents of the nodes. Observed nodes are removed from the graph.
+
+    :Args:
+      - heuristic (str): 'mindegree', 'minfill' or 'weightedminfill', see EliminationOrder
+      - vars (list): Names of the nodes of a query which are not eliminated. If not given, all nodes are eliminated.
+
+    :Returns:
+      - order (list): Names of the nodes in the order of their elimination
+    """
+    scopes, card, V = self.getQueryScopes(vars)
+    order = EliminationOrder(scopes, card, heuristic, V)
+    names = self.getVariableNames()
+    return [names[var] for var in order]
+
+  def estimateCost(self,vars=None,heuristic='minfill'):
+    """Estimate the cost of an inference before it runs
+
+    The variable elimination is simulated on the scopes of the factors, the
+    observed nodes are removed from the scopes. If no query is given, all
+    nodes are eliminated, which shows the width of the junction tree.
+
+    :Args:
+      - vars (list): Names of the nodes of a query
+      - heuristic (str): Heuristic of the elimination order, see EliminationOrder
+
+    :Returns:
+      - cost (dict): The induced ``width``, the number of entries of the largest intermediate factor ``maxFactorSize``, the number of ``flops`` and the elimination ``order``
+    """
+    scopes, card, V = self.getQueryScopes(vars)
+    order = EliminationOrder(scopes, card, heuristic, V)
+    cost = EliminationCost(scopes, card, order)
+    names = self.getVariableNames()
+    cost['order'] = [names[var] for var in order]
+    return cost
+
+  def getQueryScopes(self,vars=None):
+    """Returns the scopes of the factors after the evidence is entered
 
-    for factor in factors:
-      subfactors = []
-      suborder = factor.var
-      for idNum in suborder:
-        node = self.nodes[int(idNum)-1]
-        subfactor = Factor()
-        var, card, val = node.getInput()
-
-        subfactor.input(var,card,val)
-        subfactors.append(subfactor)
-
-      if len(suborder) != 1:
-        M = ComputeMarginal(suborder, subfactors, evidence)
-        for idx,idNum in enumerate(suborder):
-          node = self.nodes[int(idNum)-1]
-          beliefs = M[idx].val
-          card = M[idx].card
-          var = M[idx].var
+    :Args:
+      - vars (list): Names of the nodes of a query, which are kept even if they are observed
+
+    :Returns:
+      - scopes, card, V (tuple): reduced scopes and cardinalities, see getScopes, and the numbers of the query nodes
+    """
+    scopes, card = self.getScopes()
+    V = []
+    if vars is not None:
+      V = [self.getNode(name).getIdNum() for name in vars]
+    observed = set(var for var, val in self.getEvidence() if val != 0 and var not in V)
+    scopes = [[var for var in scope if var not in observed] for scope in scopes]
+    return scopes, card, V
+
+  def compileArrays(self):
+    """Returns the array-backed representation of the network
+
+    The representation is built once and reused until the network is
+    changed. It holds the full table of each node, so the table of a
+    NoisyMaxNode is expanded. The size of the expanded table is checked
+    against the memory limit, see setMemoryLimit, before it is built.
+
+    :Returns:
+      - compiled (CompiledNetwork): Array-backed representation of the network
+
+    :Raises:
+      - FactorSizeError: The full table of a noisy-MAX node would exceed the memory limit
+    """
+    if self.arrays is None:
+      for node in self.nodes:
+        if isinstance(node, NoisyMaxNode):
+          m, n = node.getTableSize()
+          CheckFactorSize(8.0*m*n, self.memoryLimit)
+      self.arrays = CompileNetwork(self)
+    return self.arrays
+
+  def share(self):
+    """Place the compiled network in shared memory, see CompiledNetwork.share
+
+    :Returns:
+      - handle (SharedNetwork): Picklable handle by which worker processes attach to the network
+    """
+    return self.compileArrays().share()
+
+  def modified(self):
+    """Invalidate all results which depend on the model
+
+    Is called if a node is added, the probabilities of a node are set or an
+    arc is added. The cached beliefs are removed and a compiled network is
+    compiled again by the next computation.
+    """
+    self.cache.clear()
+    self.junctiontree = None
+    self.arrays = None
+
+  def setMemoryLimit(self,limit,fallback=None):
+    """Set a memory limit for the exact inference
+
+    Before the exact inference allocates any factor, the size of the largest
+    factor is predicted from the elimination order or the cliques of the
+    junction tree. If it would exceed the limit, a FactorSizeError is raised
+    or, if given, the fallback is used to compute the beliefs instead.
+
+    :Args:
+      - limit (int): Maximal number of bytes of a single factor, None removes the limit
+      - fallback (function): Function which is called with the network to compute approximate beliefs if the limit is exceeded
+    """
+    self.memoryLimit = limit
+    self.fallback = fallback
+    self.junctiontree = None
+
+  def setCache(self,size):
+    """Cache the beliefs of the network for the last used evidences
+
+    If the same evidence is set again, computeBeliefs returns the stored
+    beliefs without running the inference. The least recently used entry is
+    removed if the cache is full. The cache is cleared automatically if the
+    model is changed.
+
+    :Args:
+      - size (int): Maximal number of cached evidences, 0 disables the cache
+    """
+    self.cacheSize = size
+    while len(self.cache) > self.cacheSize:
+      self.cache.popitem(last=False)
+
+  def getCacheInfo(self):
+    """Returns information about the cache
+
+    :Returns:
+      - info (dict): Number of cache ``hits`` and ``misses``, current ``size`` and ``maxsize`` of the cache
+    """
+    return {'hits': self.cacheHits, 'misses': self.cacheMisses,
+            'size': len(self.cache), 'maxsize': self.cacheSize}
+
+  def clearCache(self):
+    """Remove all cached beliefs and reset the counters"""
+    self.cache.clear()
+    self.cacheHits = 0
+    self.cacheMisses = 0
+
+  def getEvidenceKey(self):
+    """Returns the evidence in a canonical form
+
+    :Returns:
+      - key (tuple): Sorted pairs of node number and observed stage, a later evidence for the same node replaces an earlier one
+    """
+    evidence = {}
+    for var, val in self.evidence:
+      evidence[var] = val
+    return tuple(sorted((var, val) for var, val in evidence.items() if val != 0))
+
+  def compile(self,heuristic='minfill'):
+    """Compile the network into a junction tree
+
+    The junction tree is built once from the parents of the nodes. As long as
+    the network is compiled, computeBeliefs calibrates the junction tree
+    instead of eliminating the variables for each node separately. Only the
+    clique potentials which are touched by a changed evidence are recomputed
+    in later calls. If the probabilities or the structure are changed, the
+    network is compiled again by the next computation.
+
+    :Args:
+      - heuristic (str): Heuristic of the elimination order which triangulates the network, see EliminationOrder
+
+    :Returns:
+      - junctiontree (JunctionTree): The compiled junction tree
+    """
+    self.heuristic = heuristic
+    self.compiled = True
+    self.junctiontree = JunctionTree(self.getFactors(), heuristic, self.memoryLimit)
+    return self.junctiontree
+
+  def computeBeliefs(self):
+    """Compute beliefs of the network"""
+    if self.cacheSize > 0:
+      key = self.getEvidenceKey()
+      if key in self.cache:
+        self.cacheHits += 1
+        self.cache.move_to_end(key)
+        self.marginal = []
+        for node, beliefs in zip(self.nodes, self.cache[key]):
           node.setBeliefs(beliefs)
-          node.setCard(card)
-          node.setVar(var)
-          node.setVal(beliefs)
+          self.marginal.append([node, beliefs])
+        return
+      self.cacheMisses += 1
+
+    evidence = self.getEvidence()
+    self.marginal = []
+
+    try:
+      if self.compiled and self.junctiontree is None:
+        self.compile(self.heuristic)
+
+      if self.junctiontree is not None:
+        self.junctiontree.calibrate(evidence)
+        for node in self.nodes:
+          M = self.junctiontree.getMarginal(node.getIdNum())
+          node.setBeliefs(M.val)
+          self.marginal.append([node, M.val])
+      else:
+        factors = self.getFactors()
+        for node in self.nodes:
+          M = VariableElimination([node.getIdNum()], factors, evidence, limit=self.memoryLimit)
+          node.setBeliefs(M.val)
+          self.marginal.append([node, M.val])
+    except FactorSizeError:
+      if self.fallback is None:
+        raise
+      self.marginal = []
+      self.fallback(self)
+      return
+
+    if self.cacheSize > 0:
+      self.cache[key] = [beliefs for node, beliefs in self.marginal]
+      if len(self.cache) > self.cacheSize:
+        self.cache.popitem(last=False)
+
+  def estimateBeliefs(self,samples=10000,method='likelihoodweighting',seed=None,**options):
+    """Estimate the beliefs of the network by sampling
+
+    The approximate counterpart of computeBeliefs for networks whose exact
+    factors are too large. The samples are drawn from the compiled arrays of
+    the network, see compileArrays, with the evidence of getEvidence. The
+    beliefs are set like by computeBeliefs, the standard errors are returned
+    by getErrors and the diagnostics of Gibbs sampling and adaptive importance
+    sampling by getDiagnostics. The method can be used as fallback of
+    setMemoryLimit.
+
+    :Args:
+      - samples (int): Number of samples, the maximal number for 'ais'
+      - method (str): Sampling method, 'likelihoodweighting', 'gibbs' or 'ais', see LikelihoodWeighting, GibbsSampling and AdaptiveImportanceSampling
+      - seed (int): Seed of the random number generator
+      - options (dict): Further arguments of the sampling method, e.g. the number of ``chains`` and ``processes`` of GibbsSampling or the ``precision`` of AdaptiveImportanceSampling
+
+    :Raises:
+      - ValueError: The method is unknown
+      - FactorSizeError: The full table of a noisy-MAX node would exceed the memory limit, see compileArrays
+    """
+    compiled = self.compileArrays()
+    evidence = self.getArrayEvidence()
+    self.diagnostics = None
+    if method == 'likelihoodweighting':
+      beliefs, errors = LikelihoodWeighting(compiled, evidence, samples, seed, **options)
+    elif method == 'gibbs':
+      beliefs, errors, self.diagnostics = GibbsSampling(compiled, evidence, samples, seed, **options)
+    elif method == 'ais':
+      beliefs, errors, self.diagnostics = AdaptiveImportanceSampling(compiled, evidence, samples, seed, **options)
+    else:
+      raise ValueError('Error: Unknown sampling method '+str(method))
+
+    self.marginal = []
+    self.errors = errors
+    for node, p in zip(self.nodes, beliefs):
+      node.setBeliefs(p)
+      self.marginal.append([node, p])
+
+  def sample(self,n,chunk_size=65536,seed=None):
+    """Draw joint samples of all nodes by ancestral sampling, see SampleChunks
+
+    The evidence of the network is ignored. The samples are yielded in
+    chunks, i.e. the memory doesn't grow with the number of samples.
+
+    :Args:
+      - n (int): Number of samples
+      - chunk_size (int): Number of samples per chunk
+      - seed (int): Seed of the random number generator, chunk k is reproducible from the seed alone
+
+    :Returns:
+      - chunks (generator): Integer arrays with one sample per row and one column per node in the order of the network, the states start with 0
+    """
+    return SampleChunks(self.compileArrays(), n, chunk_size, seed)
+
+  def writeSamples(self,filename,n,chunk_size=65536,seed=None):
+    """Write joint samples of all nodes to a .npy or CSV file, see WriteSamples
+
+    :Args:
+      - filename (str): Name of the file, a name ending with .npy is written as NumPy array
+      - n (int): Number of samples
+      - chunk_size (int): Number of samples per chunk
+      - seed (int): Seed of the random number generator
+    """
+    WriteSamples(self.compileArrays(), filename, n, chunk_size, seed)
+
+  def fit(self,data,prior=None,chunk_size=None):
+    """Estimate the probabilities of the nodes from data
+
+    The family counts of all nodes are taken with np.bincount, see
+    FamilyCounts, and the estimated tables are set by setProbabilities. The
+    data is read in chunks, i.e. an iterable of chunks or a memory-mapped
+    array can be larger than the memory. The parameters of a NoisyMaxNode
+    are not estimated.
+
+    :Args:
+      - data (array or iterable): Integer array with one sample per row and one column per node in the order of the network, the states start with 0, or an iterable of such arrays, e.g. the chunks of sample
+      - prior (float or dict): Pseudo count of the Dirichlet prior for each entry of the tables, or a dict with the pseudo count or the pseudo counts in the order of setProbabilities for the names of some nodes. Without prior, the maximum likelihood estimate is set.
+      - chunk_size (int): Number of samples which are counted at once, see FamilyCounts
+
+    :Raises:
+      - ValueError: The data doesn't fit the nodes
+    """
+    compiled = self.compileArrays()
+    counts = FamilyCounts(compiled, data, chunk_size)
+    if isinstance(prior, dict):
+      pseudo = np.zeros(len(counts))
+      for name, value in prior.items():
+        i = self.index[name]
+        pseudo[compiled.offsets[i]:compiled.offsets[i+1]] = value
+      prior = pseudo
+    values = EstimateProbabilities(compiled, counts, prior)
+    for i, node in enumerate(self.nodes):
+      if not isinstance(node, NoisyMaxNode):
+        node.setProbabilities(values[compiled.offsets[i]:compiled.offsets[i+1]].copy())
+
+  def getArrayEvidence(self):
+    """Returns the evidence for the compiled arrays of the network
+
+    :Returns:
+      - evidence (list): Variable/value pairs, the variable of the i-th node of the network is i+1, see CompiledNetwork.getEvidence
+    """
+    position = dict((node.getIdNum(), i) for i, node in enumerate(self.nodes))
+    return [[position[var]+1, val] for var, val in self.evidence if val != 0]
+
+  def getErrors(self,vars=None):
+    """Returns the standard errors of the beliefs estimated by estimateBeliefs
+
+    :Args:
+      - vars (list): Names of the nodes, if not given the errors of all nodes are returned
+
+    :Returns:
+      - errors (list): Standard error of each belief in the order of the network
+    """
+    if vars is None:
+      return list(self.errors)
+    return [self.errors[position] for position in sorted(self.index[var] for var in vars if var in self.index)]
+
+  def getDiagnostics(self):
+    """Returns the diagnostics of the last estimate by sampling
+
+    :Returns:
+      - diagnostics (dict): For Gibbs sampling the largest ``rhat`` and the smallest effective sample size ``ess`` of the states of each node in the order of the network, see GibbsSampling, for adaptive importance sampling the number of ``samples``, the effective sample size ``ess`` of the weights and whether the ``precision`` is reached, see AdaptiveImportanceSampling, or None for likelihood weighting
+    """
+    return self.diagnostics
+
+  def computeBeliefsBatch(self,evidence,names):
+    """Compute the beliefs of the network for a batch of evidence cases
+
+    All cases are calibrated at once in the junction tree of the network. The
+    observations enter as likelihoods with the batch as extra leading axis,
+    which is carried through the factor products and marginalizations. The
+    evidence set with setEvidence is applied to all cases.
+
+    :Args:
+      - evidence (array): N-by-n array with one case per row. Column j is the number of the observed stage of node names[j], starting with 1, or 0 if the node is not observed in the case.
+      - names (list): Names of the n observed nodes
+
+    :Returns:
+      - beliefs (list): One N-by-m array for each node of the network, where m is the number of outcomes of the node
+
+    If a memory limit is set, the cases are processed in chunks such that the
+    largest batched factor fits into the limit.
+
+    :Raises:
+      - ValueError: The evidence hasn't one column per name or contains a stage which the node hasn't
+    """
+    evidence = np.asarray(evidence, dtype=int)
+    observedNodes = [self.getNode(name) for name in names]
+    if evidence.ndim != 2 or evidence.shape[1] != len(observedNodes):
+      raise ValueError('Error: The evidence has to have one column for each of the '+str(len(observedNodes))+' names')
+    for j, node in enumerate(observedNodes):
+      if np.any(evidence[:,j] < 0) or np.any(evidence[:,j] > node.getSize()):
+        raise ValueError('Error: The evidence of '+str(node)+' has to be a stage between 1 and '+str(node.getSize())+' or 0')
+    N = evidence.shape[0]
+    if self.compiled and self.junctiontree is None:
+      self.compile(self.heuristic)
+    junctiontree = self.junctiontree
+    if junctiontree is None:
+      junctiontree = JunctionTree(self.getFactors(), self.heuristic, self.memoryLimit)
+
+    chunk = max(N, 1)
+    if self.memoryLimit is not None:
+      chunk = max(1, int(self.memoryLimit // (junctiontree.maxCliqueSize*8)))
+
+    beliefs = [[np.zeros((0, node.getSize()))] for node in self.nodes]
+    # The batched likelihoods are removed even if a chunk fails, so that the
+    # junction tree of the network stays valid for computeBeliefs
+    try:
+      for start in range(0, N, chunk):
+        cases = evidence[start:start+chunk]
+        n = cases.shape[0]
+        likelihoods = {}
+        for j, node in enumerate(observedNodes):
+          card = node.getSize()
+          val = np.zeros((n, card))
+          observed = cases[:,j] != 0
+          val[np.logical_not(observed)] = 1
+          val[np.nonzero(observed)[0], cases[observed,j]-1] = 1
+          likelihood = Factor()
+          likelihood.input([node.getIdNum()], [card], val)
+          likelihoods[node.getIdNum()] = likelihood
+
+        junctiontree.setLikelihoods(likelihoods)
+        junctiontree.calibrate(self.getEvidence())
+        for k, node in enumerate(self.nodes):
+          M = junctiontree.getMarginal(node.getIdNum())
+          beliefs[k].append(np.broadcast_to(M.val, (n, node.getSize())))
+    finally:
+      junctiontree.setLikelihoods({})
+    return [np.concatenate(b) for b in beliefs]
 
   def getBeliefs(self,vars=None):
     """Returns all beliefs of the network
@@ -127,21 +677,41 @@ class Network(object):
     """
     beliefs = []
     if vars != None:
-      for mar in self.marginal:
-        for var in vars:
-          if str(mar[0]) == var:
-            beliefs.append(mar[1])
+      for position in sorted(self.index[var] for var in vars if var in self.index):
+        beliefs.append(self.marginal[position][1])
     else:
       for mar in self.marginal:
         beliefs.append(mar[1])
     return beliefs
 
 
+  def save(self,directory):
+    """Save the network in the binary format, see SaveNetwork
+
+    :Args:
+      - directory (str): Name of the directory
+    """
+    from .storage import SaveNetwork
+    SaveNetwork(self, directory)
+
+  def readFile(self,filename,extensions=True):
+    """Read the nodes of a network from an .xdsl file
+
+    :Args:
+      - filename (str): Name of the .xdsl file
+      - extensions (bool): Read the layout of the nodes, see ReadXdsl
+
+    :Returns:
+      - network (Network): The network itself
+    """
+    from .xdsl import ReadXdsl
+    return ReadXdsl(filename, self, extensions)
+
   def writeFile(self,filename):
     """Write an output file
 
     :Args:
-      - filename (str): Name of the outputfile, If no name is defined the name of the network will be used.
+      - filename (str): Name of the outputfile, If no name is defined the name of the network will be used. A name ending with .gz is written as gzip file.
 
     :Returns:
       - outputfile: The output files is saved in the local folder.
@@ -158,15 +728,67 @@ class Network(object):
     if filename == None:
       filename = self.name+'.xdsl'
 
-    f = open(filename,'w')
-    f.writelines(self.writeHeader())
-    for node in self.nodes:
-      f.write(node.printNode())
-    f.writelines(self.writeBody())
+    if filename.endswith('.gz'):
+      f = gzip.open(filename,'wt')
+    else:
+      f = open(filename,'w')
+    try:
+      self.writeStream(f)
+    finally:
+      f.close()
+
+  def writeStream(self,stream):
+    """Write the network in the .xdsl format to a stream
+
+    Every node is written directly to the stream, i.e. no string of the
+    whole file or of a whole node is built.
+
+    The nodes are written in topological order, see getTopologicalOrder,
+    since a reader needs the parents of a node before the node.
+
+    :Args:
+      - stream (file): File-like object with a write method, e.g. an open file or a gzip file
+    """
+    stream.writelines(self.writeHeader())
+    for node in self.getTopologicalOrder():
+      node.writeNode(stream)
+    stream.writelines(self.writeBody())
     for node in self.nodes:
-      f.write(node.printExtension())
-    f.writelines(self.writeFooter())
-    f.close()
+      node.writeExtension(stream)
+    stream.writelines(self.writeFooter())
+
+  def getTopologicalOrder(self):
+    """Returns the nodes of the network in topological order
+
+    Every node comes after its parents. Apart from that, the order in which
+    the nodes were added is kept, i.e. a network whose nodes were added
+    parents first is returned in its order.
+
+    :Returns:
+      - nodes (list): Nodes of the network
+
+    :Raises:
+      - ValueError: The network contains a cycle
+    """
+    children = [[] for node in self.nodes]
+    missing = [0]*len(self.nodes)
+    for i, node in enumerate(self.nodes):
+      for connection in node.getArcConnection():
+        if connection[0] in self.index:
+          children[self.index[connection[0]]].append(i)
+          missing[i] += 1
+    ready = [i for i in range(len(self.nodes)) if missing[i] == 0]
+    order = []
+    while ready != []:
+      i = heapq.heappop(ready)
+      order.append(self.nodes[i])
+      for j in children[i]:
+        missing[j] -= 1
+        if missing[j] == 0:
+          heapq.heappush(ready, j)
+    if len(order) != len(self.nodes):
+      raise ValueError('Error: The network '+self.name+' contains a cycle')
+    return order
 
   def writeHeader(self):
     header = ['<?xml version="1.0" encoding="ISO-8859-1"?>\n',
@@ -189,12 +811,15 @@ class Network(object):
       for node in self.nodes:
         if node.getOutcomes() == []:
           sys.exit("Error: Node '"+str(node)+"' has no outcomes!")
+        if isinstance(node, NoisyMaxNode):
+          if len(node.getParameters()) != len(node.getArcConnection()):
+            sys.exit("Error: Parameters for '"+str(node)+"' don't match!\n       Number of parents is "+str(len(node.getArcConnection()))+" but parameters are given for "+str(len(node.getParameters())))
+          continue
         m,n = node.getTableSize()
         nodeLen = m*n
         if len(node.getProbabilities()) != nodeLen:
           sys.exit("Error: Probabilities for '"+str(node)+"' doesn't match!\n       Len of probabilities should be "+str(nodeLen)+" but is "+str(len(node.getProbabilities())))
-        n = n+0.0
-        if str(sum(node.getProbabilities())) != str(n):
+        if not np.isclose(np.sum(node.getProbabilities()), n):
           print("Error: Probabilities for '"+str(node)+"' doesn't sum up to 1.0!")
           #sys.exit("Error: Probabilities for '"+str(node)+"' doesn't sum up to 1.0!")
 
@@ -205,21 +830,19 @@ class Node(object):
   :Attributes:
     - name (str): Name of the node
   """
-  nextIdNum = 1
   def __init__(self, name):
     self.name = repEmptySpace(name)
     self.caption = name
-    self.idNum = Node.nextIdNum
-    self.nodeId = 'Node_'+str(self.idNum)
-    Node.nextIdNum += 1
+    self.idNum = None
+    self.nodeId = None
+    self.network = None
     self.outcomes = []
     self.probabilities = []
+    self.factorValues = None
     self.nextIdOut = 0
     self.arcConnection = []
-    self.var = []
     self.card = []
     self.val = []
-    self.var.append(self.idNum)
     self.beliefs = None
 
     self.interior_color = 'e5f6f7'
@@ -240,8 +863,13 @@ class Node(object):
     return self.name
 
   def getIdNum(self):
+    """Returns the number of the node in its network, None if the node isn't added to a network"""
     return self.idNum
 
+  def setIdNum(self,idNum):
+    self.idNum = idNum
+    self.nodeId = 'Node_'+str(idNum)
+
   def getName(self):
     return self.name
 
@@ -261,21 +889,13 @@ class Node(object):
     """
     return self.card
 
-  def setVar(self,var):
-    """Set variables in the factor
-
-    :Args:
-      - var (list): List of variables (nodes) in the factor
-    """
-    self.var = var
-
   def getVar(self):
     """Returns the variables in the factor
 
     :Returns:
       - var (list): List of variables (nodes) in the factor
     """
-    return self.var
+    return [self.idNum]+self.getArcConnectionId()
 
   def setVal(self,val):
     """Set values of the node
@@ -291,7 +911,8 @@ class Node(object):
     :Returns:
       - val (list): Return a list of values for the node
     """
-
+    if self.val is None:
+      return self.transformProbabilities()
     return self.val
 
   def setBeliefs(self,beliefs):
@@ -335,7 +956,7 @@ class Node(object):
     """
     return self.outcomes
 
-  def setProbabilities(self,probabilities):
+  def setProbabilities(self,probabilities,factorValues=None):
     """Set the probabilities for the node
 
     The order of these probabilities is given by considering the state of the
@@ -345,40 +966,68 @@ class Node(object):
 
     :Args:
       - probabilities (list): A list of probabilities for the node
+      - factorValues (array): The same probabilities in the order of the factor, see transformProbabilities, which are used without copying. The parents of the node have to be connected before.
     """
     self.probabilities = probabilities
-    self.val = self.transformProbabilities()
+    # The values in the order of the factor are transformed on demand, so
+    # that a memory-mapped table isn't read before it is used
+    self.factorValues = None
+    if factorValues is not None:
+      self.factorValues = (tuple(self.getCard()), factorValues)
+    self.val = None
     self.beliefs = probabilities
+    if self.network is not None:
+      self.network.modified()
 
   def transformProbabilities(self):
-    """Transform the probabilities for the node
+    """Transform the probabilities for the node into the order of the factor
+
+    The table in GeNIe order is reshaped into one axis per parent followed by
+    the axis of the node, and the axis of the node is moved to the front. The
+    result is cached until the probabilities or the cardinalities change.
 
     :Returns:
-      - probabilities (list): Returns a list of transformed probabilities
+      - probabilities (array): Returns the transformed probabilities
     """
-    card = self.getCard()
-    probabilities = self.probabilities
+    card = tuple(self.getCard())
+    if self.factorValues is None or self.factorValues[0] != card:
+      probabilities = np.asarray(self.getProbabilities(), dtype=float)
+      if len(card) > 1 and probabilities.size == np.prod(card):
+        cpt = probabilities.reshape(card[1:]+card[:1])
+        cpt = np.transpose(cpt, [len(card)-1]+list(range(len(card)-1)))
+        probabilities = np.ravel(cpt, order='F')
+      self.factorValues = (card, probabilities)
+    return self.factorValues[1]
+
+  def getFactor(self):
+    """Returns the conditional probability table of the node as factor
 
-    if len(card) != 1:
-      card.insert(len(card), card.pop(0))
-      assignment = IndexToAssignment(np.arange(np.prod(card)),card)
-      assignment = assignment.tolist()
-      for i in range(len(card)-1,-1,-1):
-        assignment.sort(key=lambda x: x[i])
-
-      for i,item in enumerate(assignment):
-        item.append(probabilities[i])
+    :Returns:
+      - factor (Factor): Factor over the node and its parents
+    """
+    factor = Factor()
+    # The values aren't copied, so that a memory-mapped table is shared
+    factor.var = np.array(self.getVar())
+    factor.card = np.array(self.getCard(), dtype='i')
+    factor.val = self.transformProbabilities()
+    factor.name = self.name
+    return factor
 
-      assignment.sort(key=lambda x: x[len(card)-1])
+  def getFactors(self):
+    """Returns the factors of the node
 
-      for i in range(len(card)-1):
-        assignment.sort(key=lambda x: x[i])
+    :Returns:
+      - factors (list): List with the conditional probability table of the node as factor, see getFactor
+    """
+    return [self.getFactor()]
 
-      probabilities = []
-      for item in assignment:
-        probabilities.append(item[-1])
+  def getScopes(self):
+    """Returns the scopes of the factors of the node
 
-    return probabilities
+    :Returns:
+      - scopes (list): List with the number of the node followed by the numbers of its parents
+    """
+    return [[self.idNum]+self.getArcConnectionId()]
 
   def getProbabilities(self):
     """Returns a list of probabilities
@@ -403,14 +1052,30 @@ class Node(object):
     return self.arcConnection
 
   def getArcConnectionId(self):
+    """Returns the numbers of the parents in their network"""
     ids = []
     for connection in self.arcConnection:
-      ids.append(connection[1])
+      if len(connection) > 3:
+        ids.append(connection[3].getIdNum())
+      else:
+        ids.append(connection[1])
     return ids
 
-  def addArcConnection(self,name,id,size):
-    self.arcConnection.append([name,id,size])
-    self.var.append(id)
+  def addArcConnection(self,name,id,size,node=None):
+    """Add a parent to the node
+
+    :Args:
+      - name (str): Name of the parent
+      - id (int): Number of the parent, only used if the parent node isn't given
+      - size (int): Number of outcomes of the parent
+      - node (Node): Parent node, whose number is looked up when it is needed
+    """
+    if node is None:
+      self.arcConnection.append([name,id,size])
+    else:
+      self.arcConnection.append([name,id,size,node])
+    if self.network is not None:
+      self.network.modified()
 
   def getTableSize(self):
     """Returns the size of the probability table
@@ -455,7 +1120,7 @@ class Node(object):
        val value of the node
     """
     card = self.getCard()
-    return self.var, card, self.val
+    return self.getVar(), card, self.getVal()
 
   def getTable(self):
     return self.tableSize
@@ -464,48 +1129,58 @@ class Node(object):
     return len(self.outcomes)
 
   def printNode(self):
-    # print node
-    commentNode = '\t\t<!-- create node "'+self.caption+'" -->\n'
-    initNode = '\t\t<cpt id="'+self.name+'" >\n'
-    commentOutcomes = '\t\t\t<!-- setting names of outcomes -->\n'
-    initOutcomes = ''
-    for outcome in self.outcomes:
-      initOutcomes += '\t\t\t<state id="'+outcome+'" />\n'
+    """Returns the node element of the .xdsl file, see writeNode"""
+    stream = StringIO()
+    self.writeNode(stream)
+    return stream.getvalue()
 
+  def writeNode(self,stream):
+    """Write the node element of the .xdsl file
+
+    The element is written in chunks, the probabilities are formatted in
+    blocks of an array, i.e. the time is linear in the size of the table.
+
+    :Args:
+      - stream (file): File-like object with a write method
+    """
+    stream.write('\t\t<!-- create node "'+self.caption+'" -->\n')
+    stream.write('\t\t<cpt id="'+self.name+'" >\n')
+    self.writeOutcomes(stream)
     if self.arcConnection != []:
-      # print arc
-      commentArc = '\t\t\t<!-- add arcs -->\n'
-      initArc = '\t\t\t<parents>'
-      for connection in self.arcConnection:
-        initArc += connection[0]+' '
-      endArc =  '</parents>\n'
-    else:
-      commentArc = ''
-      initArc = ''
-      endArc = ''
-
-    # print probabilities
-    commentProbabilities = '\t\t\t<!-- setting probabilities -->\n'
-    initProbabilities = '\t\t\t<probabilities>'
-    for i,probability in enumerate(self.probabilities):
-      initProbabilities += str(probability)+' '
-    endProbabilities = '</probabilities>\n'
-    endNode = '\t\t</cpt>\n'
-    print_node =  commentNode+initNode+commentOutcomes+initOutcomes+commentArc+initArc+endArc+commentProbabilities+initProbabilities+endProbabilities+endNode
-    return print_node
+      stream.write('\t\t\t<!-- add arcs -->\n')
+      stream.write('\t\t\t<parents>'+''.join(connection[0]+' ' for connection in self.arcConnection)+'</parents>\n')
+    stream.write('\t\t\t<!-- setting probabilities -->\n')
+    stream.write('\t\t\t<probabilities>')
+    writeValues(stream, self.probabilities)
+    stream.write('</probabilities>\n')
+    stream.write('\t\t</cpt>\n')
+
+  def writeOutcomes(self,stream):
+    stream.write('\t\t\t<!-- setting names of outcomes -->\n')
+    for outcome in self.outcomes:
+      stream.write('\t\t\t<state id="'+outcome+'" />\n')
 
   def printExtension(self):
-    initExtensions = '\t\t\t<node id="'+self.name+'">\n'
-    initName = '\t\t\t\t<name>'+self.caption+'</name>\n'
-    initIcolor = '\t\t\t\t<interior color="'+self.interior_color+'" />\n'
-    initOcolor = '\t\t\t\t<outline color="'+self.outline_color+'" />\n'
-    initFont = '\t\t\t\t<font color="'+self.font_color+'" name="'+self.font_name+'" size="'+str(self.font_size)+'" />\n'
-    initPos = '\t\t\t\t<position>'+str(self.node_position[0])+' '+str(self.node_position[1])+' '+str(self.node_position[2])+' '+str(self.node_position[3])+'</position>\n'
-    initBar = ''
+    """Returns the node element of the extensions, see writeExtension"""
+    stream = StringIO()
+    self.writeExtension(stream)
+    return stream.getvalue()
+
+  def writeExtension(self,stream):
+    """Write the node element of the extensions of the .xdsl file
+
+    :Args:
+      - stream (file): File-like object with a write method
+    """
+    stream.write('\t\t\t<node id="'+self.name+'">\n')
+    stream.write('\t\t\t\t<name>'+self.caption+'</name>\n')
+    stream.write('\t\t\t\t<interior color="'+self.interior_color+'" />\n')
+    stream.write('\t\t\t\t<outline color="'+self.outline_color+'" />\n')
+    stream.write('\t\t\t\t<font color="'+self.font_color+'" name="'+self.font_name+'" size="'+str(self.font_size)+'" />\n')
+    stream.write('\t\t\t\t<position>'+' '.join(str(x) for x in self.node_position[:4])+'</position>\n')
     if self.bar_active == True:
-      initBar = '\t\t\t\t<barchart active="true" width="'+str(self.node_size[2])+'" height="'+str(self.node_size[3])+'" />\n'
-    endExtensions = '\t\t\t</node>\n'
-    return initExtensions+initName+initIcolor+initOcolor+initFont+initPos+initBar+endExtensions
+      stream.write('\t\t\t\t<barchart active="true" width="'+str(self.node_size[2])+'" height="'+str(self.node_size[3])+'" />\n')
+    stream.write('\t\t\t</node>\n')
 
   def printProbabilities(self):
     commentProbabilities = '// setting probabilities for "'+self.name+'"\ntheProbs.Flush();\n'
@@ -602,7 +1277,7 @@ class Node(object):
   def getNodePosition(self):
     return self.node_position
 
-  def setBarActive(bar_active):
+  def setBarActive(self,bar_active):
     """View node as Icon or Bar Chart
 
     :Args:
@@ -611,6 +1286,196 @@ class Node(object):
     """
     self.bar_active = bar_active
 
+class NoisyMaxNode(Node):
+  """Noisy-MAX node element for the Bayesian Network
+
+  The conditional probability table of a noisy-MAX node is given by one
+  distribution for each state of each parent and a leak distribution, i.e.
+  the number of parameters grows linearly in the number of parents instead of
+  exponentially. Each parent causes a state of the node independently of the
+  other parents, and the node takes the highest of these states. The first
+  outcome of the node is the highest and its last outcome is the
+  distinguished (absent) state. The last outcome of a parent is its
+  distinguished state, which causes the last outcome of the node. Noisy-OR is
+  the special case of a binary node, see setNoisyOr.
+
+  The full table is never built for the inference. It is factorised by the
+  multiplicative decomposition of Díez and Galán with an auxiliary variable
+  Y' with the outcomes of the node Y, i.e. a factor over Y,Y', one factor
+  over Y',X_i for each parent X_i and one leak factor over Y'. The factor of
+  parent X_i holds the probability P(Y_i >= y'|x_i) of the cause X_i to
+  produce a state not higher than y'.
+
+  :Attributes:
+    - name (str): Name of the node
+  """
+
+  def __init__(self, name):
+    Node.__init__(self, name)
+    self.parameters = []
+    self.leak = None
+
+  def getAuxIdNum(self):
+    """Returns the number of the auxiliary variable Y' of the factors"""
+    return -self.idNum
+
+  def setParameters(self,parameters,leak=None):
+    """Set the parameters of the node
+
+    :Args:
+      - parameters (list): A list for each parent in the order of the arcs. Each list holds the probabilities of the outcomes of the node for each outcome of the parent, the state of the parent is the most significant coordinate. The probabilities for the last outcome of a parent have to be 0,...,0,1.
+      - leak (list): Probabilities of the outcomes of the node if all parents are in their distinguished state, by default 0,...,0,1
+
+    :Raises:
+      - ValueError: The number of parameters doesn't match the parents
+    """
+    m = self.getSize()
+    if len(parameters) != len(self.arcConnection):
+      raise ValueError('Error: Parameters for '+str(len(parameters))+' parents are given, but '+self.name+' has '+str(len(self.arcConnection))+' parents')
+    self.parameters = []
+    for connection, parameter in zip(self.arcConnection, parameters):
+      parameter = np.asarray(parameter, dtype=float)
+      if parameter.size != connection[2]*m:
+        raise ValueError('Error: Parameters for the parent '+connection[0]+' of '+self.name+' should have '+str(connection[2]*m)+' values')
+      self.parameters.append(parameter.reshape(connection[2], m))
+    if leak is None:
+      leak = np.eye(m)[-1]
+    self.leak = np.asarray(leak, dtype=float)
+    self.factorValues = None
+    self.beliefs = None
+    if self.network is not None:
+      self.network.modified()
+
+  def setNoisyOr(self,probabilities,leak=0.0):
+    """Set the parameters of a binary noisy-OR node
+
+    :Args:
+      - probabilities (list): Probability for each parent in the order of the arcs that the parent alone causes the first outcome of the node, if the parent isn't in its last outcome
+      - leak (float): Probability of the first outcome of the node if all parents are in their last outcome
+
+    :Raises:
+      - ValueError: The node isn't binary
+    """
+    if self.getSize() != 2:
+      raise ValueError('Error: Noisy-OR node '+self.name+' has to have two outcomes')
+    parameters = []
+    for connection, p in zip(self.arcConnection, probabilities):
+      parameter = [[p, 1-p]]*(connection[2]-1)+[[0.0, 1.0]]
+      parameters.append(np.ravel(parameter))
+    self.setParameters(parameters, [leak, 1-leak])
+
+  def getParameters(self):
+    """Returns the parameters of the node
+
+    :Returns:
+      - parameters (list): An array of the probabilities of the outcomes of the node for each outcome of the parent, for each parent
+    """
+    return self.parameters
+
+  def getLeak(self):
+    """Returns the leak probabilities, by default 0,...,0,1"""
+    if self.leak is None:
+      return np.eye(self.getSize())[-1]
+    return self.leak
+
+  def getCumulative(self):
+    """Returns the cumulative probabilities of the causes
+
+    :Returns:
+      - leak, parents (tuple): leak are the probabilities P(Y_L >= y) of the leak and parents a list of arrays with the probabilities P(Y_i >= y|x_i) for each parent, with the outcome y of the node as last axis
+    """
+    cumulative = lambda p: np.cumsum(p[..., ::-1], axis=-1)[..., ::-1]
+    return cumulative(self.getLeak()), [cumulative(parameter) for parameter in self.parameters]
+
+  def getProbabilities(self):
+    """Returns the full probability table of the node
+
+    The table is expanded from the parameters in the order of setProbabilities,
+    its size grows exponentially in the number of parents.
+
+    :Returns:
+      - probabilities (array): Returns the probabilities
+    """
+    leak, parents = self.getCumulative()
+    k = len(parents)
+    G = leak
+    for i, cumulative in enumerate(parents):
+      G = G*np.reshape(cumulative, (1,)*i+cumulative.shape[:1]+(1,)*(k-i-1)+cumulative.shape[1:])
+    G = np.reshape(G, tuple(c[2] for c in self.arcConnection)+(self.getSize(),))
+    P = G-np.concatenate([G[..., 1:], np.zeros(G.shape[:-1]+(1,))], axis=-1)
+    return np.ravel(P)
+
+  def getProbability(self,index):
+    return self.getProbabilities()[index]
+
+  def transformProbabilities(self):
+    """The full table of a noisy-MAX node isn't built for the inference
+
+    The values of a single factor, which getVal and getInput return for a
+    Node, don't exist for a noisy-MAX node, see getFactors.
+
+    :Raises:
+      - ValueError: Always
+    """
+    raise ValueError('Error: Noisy-MAX node '+self.name+' has no single factor, see getFactors')
+
+  def getVal(self):
+    """Raises a ValueError, see transformProbabilities"""
+    return self.transformProbabilities()
+
+  def getFactors(self):
+    """Returns the factorised probability table of the node
+
+    :Returns:
+      - factors (list): The factor over Y,Y', a factor over Y',X_i for each parent X_i and the leak factor over Y'
+    """
+    m = self.getSize()
+    aux = self.getAuxIdNum()
+    leak, parents = self.getCumulative()
+
+    # P(y|x) = P(Y >= y|x)-P(Y >= y+1|x)
+    delta = Factor()
+    delta.input([self.idNum, aux], [m, m], np.ravel(np.eye(m)-np.eye(m, k=1), order='F'))
+    delta.name = self.name
+    factors = [delta]
+    for connection, id, cumulative in zip(self.arcConnection, self.getArcConnectionId(), parents):
+      factor = Factor()
+      factor.input([aux, id], [m, connection[2]], np.ravel(cumulative))
+      factor.name = self.name
+      factors.append(factor)
+    factor = Factor()
+    factor.input([aux], [m], leak)
+    factor.name = self.name
+    factors.append(factor)
+    return factors
+
+  def getScopes(self):
+    """Returns the scopes of the factors of the node, see getFactors"""
+    aux = self.getAuxIdNum()
+    return [[self.idNum, aux]]+[[aux, id] for id in self.getArcConnectionId()]+[[aux]]
+
+  def writeNode(self,stream):
+    """Write the noisymax element of the .xdsl file
+
+    The states of each parent are given in the order of its outcomes, i.e.
+    its last outcome is the distinguished state.
+
+    :Args:
+      - stream (file): File-like object with a write method
+    """
+    stream.write('\t\t<!-- create node "'+self.caption+'" -->\n')
+    stream.write('\t\t<noisymax id="'+self.name+'" >\n')
+    self.writeOutcomes(stream)
+    if self.arcConnection != []:
+      stream.write('\t\t\t<!-- add arcs -->\n')
+      stream.write('\t\t\t<parents>'+' '.join(connection[0] for connection in self.arcConnection)+'</parents>\n')
+      stream.write('\t\t\t<strengths>'+' '.join(' '.join(str(i) for i in range(connection[2])) for connection in self.arcConnection)+'</strengths>\n')
+    stream.write('\t\t\t<!-- setting parameters -->\n')
+    stream.write('\t\t\t<parameters>')
+    writeValues(stream, np.concatenate([np.ravel(parameter) for parameter in self.parameters]+[self.getLeak()]), ' ', '')
+    stream.write('</parameters>\n')
+    stream.write('\t\t</noisymax>\n')
+
 class Arc(object):
   """Arc between two nodes
 
@@ -622,11 +1487,29 @@ class Arc(object):
   def __init__(self, from_node, to_node):
     self.from_node = from_node
     self.to_node = to_node
-    self.to_node.addArcConnection(self.from_node.getName(),self.from_node.getIdNum(),self.from_node.getSize())
+    self.to_node.addArcConnection(self.from_node.getName(),self.from_node.getIdNum(),self.from_node.getSize(),self.from_node)
 
   def __repr__(self):
     return self.name
 
+def writeValues(stream, values, sep=' ', end=' ', size=65536):
+  """Write a list of numbers to a stream in blocks
+
+  :Args:
+    - stream (file): File-like object with a write method
+    - values (list): Numbers to write
+    - sep (str): Separator between two numbers
+    - end (str): String written after the last number
+    - size (int): Number of values formatted at once
+  """
+  values = np.ravel(values)
+  for i in range(0, len(values), size):
+    if i > 0:
+      stream.write(sep)
+    stream.write(sep.join(map(str, values[i:i+size].tolist())))
+  if len(values) > 0:
+    stream.write(end)
+
 def repEmptySpace(string):
   return string.replace(' ', '_')
 
@@ -1,8 +1,31 @@
 #!/usr/bin/python -tt
 # -*- coding: utf-8 -*-
 
+import heapq
 import numpy as np
 import numpy.matlib
+from functools import lru_cache
+from itertools import combinations
+
+# Maximal number of bytes of a single factor, None for no limit
+memoryLimit = None
+
+# Maximal number of cached strides and alignment plans of each kind
+planCacheSize = 4096
+
+# Factors with a fraction of nonzero values below sparseThreshold and at
+# least sparseMinSize values are stored as SparseFactor, None for dense only
+sparseThreshold = 0.25
+sparseMinSize = 64
+
+class FactorSizeError(MemoryError):
+  """Factor Size Error
+
+  Is raised before a factor is allocated whose size would exceed the memory
+  limit, see SetMemoryLimit.
+  """
+  pass
+
 
 class Factor(object):
   """Factor
@@ -16,6 +39,10 @@ class Factor(object):
     - var (list): List of variables in the factor, e.g. [1 2 3]
     - card (list): List of cardinalities corresponding to .var, e.g. [2 2 2]
     - val (list): Value table of size prod(card)
+
+  For batched inference val can also be an N-by-prod(card) array. Each row is
+  the value table of one of N cases, i.e. the batch is carried as an extra
+  leading axis through the factor operations.
   """
 
   def __init__(self):
@@ -51,6 +78,37 @@ class Factor(object):
     return self.name
 
 
+class SparseFactor(Factor):
+  """Sparse Factor
+
+  Factor which only stores its nonzero values, e.g. for deterministic
+  conditional probability tables or factors with many inconsistent values
+  after observing evidence (coordinate format). The factor operations accept
+  sparse and dense factors, see AutoFactor for the choice between them.
+  Sparse factors are never batched.
+
+  :Attributes:
+    - name (str): Name of the factor
+    - var (list): List of variables in the factor, e.g. [1 2 3]
+    - card (list): List of cardinalities corresponding to .var, e.g. [2 2 2]
+    - idx (list): Sorted indices of the nonzero values into the value table of size prod(card)
+    - val (list): Nonzero values, val[i] is the value of entry idx[i]
+  """
+
+  def __init__(self):
+    Factor.__init__(self)
+    self.idx = None
+
+  def getIdx(self):
+    return self.idx
+
+  def input(self, var, card, idx, val):
+    self.var = np.array(var)
+    self.card = np.array(card, dtype='i')
+    self.idx = np.array(idx, dtype=np.int64)
+    self.val = np.array(val, dtype=float)
+
+
 def FactorProduct(A,B):
   """Factor Product Computes the product of two factors.
 
@@ -71,52 +129,42 @@ def FactorProduct(A,B):
   """
   C = Factor()
   # Check for empty factors
-  if A.var == np.array([]):
+  if len(A.var) == 0:
     C = B
     return C
-  if B.var == np.array([]):
+  if len(B.var) == 0:
     C = A
     return C
   else:
+    # Sparse factors are multiplied by joining their nonzero values, batched
+    # factors are always dense
+    if isinstance(A, SparseFactor) or isinstance(B, SparseFactor):
+      if BatchShape(A, B) == ():
+        return SparseFactorProduct(A, B)
+      A, B = ToDense(A), ToDense(B)
+
+    # The variables and cardinalities of C only depend on the scopes of A and
+    # B, and are looked up in a cache of precomputed plans
+    var, card, mismatch = _productPlan(tuple(A.var.tolist()), tuple(A.card.tolist()),
+                                       tuple(B.var.tolist()), tuple(B.card.tolist()))
     # Check that variables in both A and B have the same cardinality
-    dummy = np.intersect1d(A.var, B.var)
-    if dummy == np.array([]):
+    if mismatch:
       print('Dimensionality mismatch in factors')
-
-    # Set the variables of C
-    C.var = np.union1d(A.var, B.var)
-
-    # Construct the mapping between variables in A and B and variables in C.
-    # In the code below, we have that
-    #    mapA(i) = j, if and only if, A.var(i) == C.var(j)
-    # and similarly 
-    #    mapB(i) = j, if and only if, B.var(i) == C.var(j)
-    # For example, if A.var = [3 1 4], B.var = [4 5], and C.var = [1 3 4 5],
-    # then, mapA = [2 1 3] and mapB = [3 4]; mapA(1) = 2 because A.var(1) = 3
-    # and C.var(2) = 3, so A.var(1) == C.var(2).
-
-    dummy, ixA = ismember(A.var,C.var)
-    mapA = (A.var[dummy])
-    dummy, ixB = ismember(B.var,C.var)
-    mapB = (B.var[dummy])
-
-    # Set the cardinality of variables in C
-    C.card = np.zeros(len(C.var))
-    C.card[ixA] = A.card
-    C.card[ixB] = B.card
-
-    # Initialize the factor values of C:
-    #   prod(C.card) is the number of entries in C
-    C.val = np.zeros(np.prod(C.card).astype(int))
-
-    # Compute some helper indices
-    assignment = IndexToAssignment(np.arange(np.prod(C.card)),C.card)
-    indxA =  AssignmentToIndex(assignment[:,ixA], A.card).astype(int)
-    indxB =  AssignmentToIndex(assignment[:,ixB], B.card).astype(int)
-
-    # Correctly populate the factor values of C
-    for i in range(int(np.prod(C.card))):
-      C.val[i] = A.val[indxA[i]]*B.val[indxB[i]]
+    C.var = np.array(var)
+    C.card = np.array(card, dtype='i')
+
+    # Align A and B as n-d arrays over the axes of C, i.e. variables which
+    # are not in the factor get an axis of length one, and multiply them by
+    # broadcasting. The values are stored with the first variable changing
+    # fastest, so the result is written in Fortran order.
+    a = FactorArray(A, C.var)
+    b = FactorArray(B, C.var)
+    shape = np.broadcast_shapes(a.shape, b.shape)
+    dtype = np.result_type(a, b)
+    CheckFactorSize(np.prod(shape, dtype=float)*dtype.itemsize)
+    val = np.empty(shape, dtype=dtype, order='F')
+    np.multiply(a, b, out=val)
+    C.val = np.reshape(val, BatchShape(A, B)+(-1,), order='F')
 
     return C
 
@@ -145,32 +193,41 @@ def FactorMarginalization(A, V):
   B = Factor()
 
   # Check for empty factors
-  if A.var == np.array([]) and V == np.array([]):
+  if len(A.var) == 0 and len(V) == 0:
     B = A
     return B
   else:
 
     # Construct the output factor over A.var \ V
     # (the variables in A.var that are not in V)
-    # and mapping between variables in A and B
-    B.var, mapB = setdiff(A.var,V)
+    # and the axes of A which are summed out
+    var = tuple(A.var.tolist())
+    keep, axes = _marginalizationPlan(var, tuple(np.ravel(V).tolist()))
+    B.var = A.var[list(keep)]
 
     # Check for empty resultant factor
-    if B.var == np.array([]):
+    if len(B.var) == 0:
       print('Error: Resultant factor has empty scope')
     else:
 
-      # Initialize B.card and B.val
-      B.card = A.card[mapB]
-      B.val = np.zeros(np.prod(B.card).astype(int))
-
-      # Compute some helper indices
-      assignment = IndexToAssignment(np.arange(np.prod(A.card)),A.card)
-      indxB =  AssignmentToIndex(assignment[:,mapB], B.card).astype(int)
-
-      # Correctly populate the factor values of B
-      for i in range(int(len(indxB))):
-        B.val[indxB[i]] += A.val[i]
+      # Initialize B.card
+      B.card = A.card[list(keep)]
+
+      # Sum the nonzero values of a sparse factor with the same remaining
+      # assignment
+      if isinstance(A, SparseFactor):
+        idx = np.dot(_assignments(A)[:, list(keep)], _strides(tuple(B.card.tolist())))
+        idx, inverse = np.unique(idx, return_inverse=True)
+        S = SparseFactor()
+        S.input(B.var, B.card, idx, np.bincount(inverse, weights=A.val, minlength=len(idx)))
+        return S
+
+      # Sum all variables of V out at once over the corresponding axes of
+      # the values of A, which are viewed as n-d array
+      batch = BatchShape(A)
+      axes = tuple(axis+len(batch) for axis in axes)
+      val = np.sum(np.reshape(A.val, batch+tuple(A.card), order='F'), axis=axes)
+      B.val = np.reshape(val, batch+(-1,), order='F')
 
       return B
 
@@ -213,24 +270,218 @@ def ObserveEvidence(F, E):
         if x > F[j].card[indx] or x < 0:
           print('Error: Invalid evidence, X_'+str(v)+' = '+str(x))
 
-        # Compute some helper indices
-        assignment = IndexToAssignment(np.arange(np.prod(F[j].card)),F[j].card)
-        idnxF = indices(F[j].var, lambda x: x == v)
-
-        # Factor F(j) to account for observed evidence
-        A = np.array([assignment[0]])
-        for i in range(len(assignment)):
-          if assignment[i][idnxF] != x:
-            A = np.append(A,[assignment[i]],0)
-
-        A = np.delete(A,0,0)
-        F[j] = SetValueOfAssignment(F[j], A, 0,)
+        # Factor F(j) to account for observed evidence, i.e. all values
+        # along the axis of v which are not consistent with x are set to zero
+        val = np.reshape(F[j].val, F[j].card, order='F')
+        val = np.moveaxis(val, indx[0], 0)
+        val[np.arange(F[j].card[indx[0]]) != x-1] = 0
+        F[j].val = np.ravel(np.moveaxis(val, 0, indx[0]), order='F')
 
         # Check validity of evidence / resulting factor
-        if F[j].val == np.array([]):
+        if len(F[j].val) == 0:
           print('Warning: Factor '+str(j)+' makes variable assignment impossible')
   return F
 
+def FactorReduction(F, E):
+  """Factor Reduction Reduce a vector of factors given some evidence.
+
+  ``F = FactorReduction(F, E)`` slices the observed value out of every factor
+  in F which contains an observed variable. In contrast to ObserveEvidence
+  the observed variable is removed from the factor, i.e. the factor shrinks
+  by the cardinality of the variable and later products become smaller. A
+  factor whose variables are all observed is reduced to a constant factor
+  with an empty scope.
+
+  :Args:
+    - F (list): List of factors
+    - E (tuple): E is an N-by-2 matrix, where each row consists of a variable/value pair.\n
+  Variables are in the first column and values are in the second column. Rows with a value of 0 are ignored.
+
+  :Returns:
+    - F (list): Return a list of new, reduced factors
+  """
+  evidence = {}
+  for v, x in E:
+    if x != 0:
+      evidence[v] = x
+
+  R = []
+  for factor in F:
+    keep = [i for i, v in enumerate(factor.var) if v not in evidence]
+    if len(keep) == len(factor.var):
+      R.append(factor)
+      continue
+
+    # Keep the nonzero values of a sparse factor which are consistent with
+    # the evidence
+    if isinstance(factor, SparseFactor):
+      A = _assignments(factor)
+      consistent = np.ones(len(factor.idx), dtype=bool)
+      for i, v in enumerate(factor.var):
+        if v in evidence:
+          consistent &= A[:, i] == evidence[v]-1
+      reduced = SparseFactor()
+      reduced.input(factor.var[keep], factor.card[keep],
+                    np.dot(A[consistent][:, keep], _strides(tuple(factor.card[keep].tolist()))),
+                    factor.val[consistent])
+      if keep == []:
+        reduced = ToDense(reduced)
+      reduced.name = factor.name
+      R.append(reduced)
+      continue
+
+    # Select the observed value along the axis of each observed variable
+    batch = BatchShape(factor)
+    index = [slice(None)]*len(batch)
+    for i, v in enumerate(factor.var):
+      if v in evidence:
+        x = evidence[v]
+        if x > factor.card[i] or x < 0:
+          print('Error: Invalid evidence, X_'+str(v)+' = '+str(x))
+        index.append(x-1)
+      else:
+        index.append(slice(None))
+    val = np.reshape(factor.val, batch+tuple(factor.card), order='F')[tuple(index)]
+
+    reduced = Factor()
+    reduced.input(factor.var[keep], factor.card[keep], np.reshape(val, batch+(-1,), order='F'))
+    reduced.name = factor.name
+    R.append(reduced)
+  return R
+
+
+def SparseFactorProduct(A, B):
+  """Sparse Factor Product Computes the product of two unbatched factors.
+
+  Only the nonzero values of A and B are multiplied. The nonzero values are
+  joined on the assignment of the variables which A and B have in common,
+  i.e. the product has at most nnz(A)*nnz(B) nonzero values and no dense
+  table of the size of the product is built. Dense factors are converted to
+  sparse ones first.
+
+  :Args:
+    - A (Factor): Factor A
+    - B (Factor): Factor B
+
+  :Returns:
+    - C (SparseFactor): Return factor C
+  """
+  A, B = ToSparse(A), ToSparse(B)
+  var, card, mismatch = _productPlan(tuple(A.var.tolist()), tuple(A.card.tolist()),
+                                     tuple(B.var.tolist()), tuple(B.card.tolist()))
+  if mismatch:
+    print('Dimensionality mismatch in factors')
+  var = list(var)
+  strides = _strides(card)
+  assignmentA = _assignments(A)
+  assignmentB = _assignments(B)
+
+  # Key of the assignment of the common variables of each nonzero value
+  varB = B.var.tolist()
+  common = [v for v in A.var.tolist() if v in varB]
+  cardCommon = tuple(card[var.index(v)] for v in common)
+  keyA = np.dot(assignmentA[:, [A.var.tolist().index(v) for v in common]], _strides(cardCommon))
+  keyB = np.dot(assignmentB[:, [varB.index(v) for v in common]], _strides(cardCommon))
+
+  # Pair every nonzero value of A with the range of nonzero values of B with
+  # the same key
+  sort = np.argsort(keyB, kind='stable')
+  keyB = keyB[sort]
+  lo = np.searchsorted(keyB, keyA, side='left')
+  count = np.searchsorted(keyB, keyA, side='right')-lo
+  n = int(np.sum(count))
+  CheckFactorSize(n*16.0)
+  iA = np.repeat(np.arange(len(A.idx)), count)
+  iB = sort[np.repeat(lo-np.cumsum(count)+count, count)+np.arange(n)]
+
+  # Index of each pair in the value table of C
+  offsetA = np.dot(assignmentA, strides[[var.index(v) for v in A.var.tolist()]])
+  only = [i for i, v in enumerate(varB) if v not in common]
+  offsetB = np.dot(assignmentB[:, only], strides[[var.index(varB[i]) for i in only]])
+  idx = offsetA[iA]+offsetB[iB]
+  sort = np.argsort(idx, kind='stable')
+
+  C = SparseFactor()
+  C.input(var, card, idx[sort], (A.val[iA]*B.val[iB])[sort])
+  return C
+
+
+def ToSparse(F):
+  """Returns a factor as SparseFactor
+
+  :Args:
+    - F (Factor): Unbatched dense or sparse factor
+
+  :Returns:
+    - S (SparseFactor): Factor with the nonzero values of F, F itself if it is sparse
+  """
+  if isinstance(F, SparseFactor):
+    return F
+  idx = np.flatnonzero(F.val)
+  S = SparseFactor()
+  S.input(F.var, F.card, idx, np.ravel(F.val)[idx])
+  S.name = F.name
+  return S
+
+
+def ToDense(F):
+  """Returns a factor as dense Factor
+
+  :Args:
+    - F (Factor): Dense or sparse factor
+
+  :Returns:
+    - D (Factor): Factor with the full value table of F, F itself if it is dense
+  """
+  if not isinstance(F, SparseFactor):
+    return F
+  val = np.zeros(int(np.prod(F.card)))
+  val[F.idx] = F.val
+  D = Factor()
+  D.input(F.var, F.card, val)
+  D.name = F.name
+  return D
+
+
+def AutoFactor(F):
+  """Chooses the dense or sparse representation of a factor
+
+  A factor with at least sparseMinSize values is stored sparse if the
+  fraction of its nonzero values is below sparseThreshold, and dense
+  otherwise. Batched factors and factors with an empty scope stay dense.
+
+  :Args:
+    - F (Factor): Dense or sparse factor
+
+  :Returns:
+    - F (Factor): F in the chosen representation
+  """
+  if sparseThreshold is None or len(F.var) == 0 or BatchShape(F) != ():
+    return ToDense(F)
+  size = np.prod(F.card, dtype=float)
+  if size < sparseMinSize:
+    return ToDense(F)
+  if isinstance(F, SparseFactor):
+    nnz = len(F.val)
+  else:
+    nnz = np.count_nonzero(F.val)
+  if nnz < sparseThreshold*size:
+    return ToSparse(F)
+  return ToDense(F)
+
+
+def SetSparseThreshold(threshold, minSize=64):
+  """Set the threshold of the sparse factor representation, see AutoFactor
+
+  :Args:
+    - threshold (float): Maximal fraction of nonzero values of a sparse factor, None to use dense factors only
+    - minSize (int): Minimal number of values of a sparse factor
+  """
+  global sparseThreshold, sparseMinSize
+  sparseThreshold = threshold
+  sparseMinSize = minSize
+
+
 def SetValueOfAssignment(F, A, v, VO=None):
   if VO == None:
     #print A
@@ -304,21 +555,294 @@ def ComputeMarginal(V, F, E):
   M = []
   for i in range(len(V)):
     D = R
-    for ii in range(len(R.var)):
-      if R.var[ii] != V[i]:
-        D = FactorMarginalization(D, [R.var[ii]])
+    others = [var for var in R.var if var != V[i]]
+    if others != []:
+      D = FactorMarginalization(R, others)
     M.append(D)
   return M
 
 
+def VariableElimination(V, F, E, order=None, limit=None):
+  """Variable Elimination Computes the marginal over a set of given variables.
+
+  ``M = VariableElimination(V, F, E)`` computes the marginal over variables V
+  in the distribution induced by the set of factors F, given evidence E.
+
+  In contrast to ComputeMarginal the joint distribution is never built. Each
+  variable which is not in V is summed out of the product of only those
+  factors which contain it (sum-product variable elimination). The size of
+  the intermediate factors is therefore bounded by the width of the
+  elimination order and not by the number of variables in the network.
+
+  :Args:
+    - V (list): V is a list containing the variables in the marginal e.g. [1 2 3] for X_1, X_2 and X_3.
+    - F (list): F is a list of factors containing the factors defining the distribution
+    - E (tuple): E is an N-by-2 matrix, each row being a variable/value pair.\n
+    Variables are in the first column and values are in the second column.\n
+    If there is no evidence, pass in the empty matrix [] for E.
+    - order (list): Order in which the variables are eliminated. If no order is given, the order is computed by the weighted min-fill heuristic, see EliminationOrder.
+    - limit (int): Maximal number of bytes of an intermediate factor. If the elimination would create a larger factor, a FactorSizeError is raised before the elimination starts.
+
+  :Returns:
+    - M (Factor): M is a renormalized factor containing the marginal over variables V
+  """
+
+  # Compute observed evidence. Observed variables which are not in V are
+  # sliced out of the factors, observed variables in V are kept in the scope
+  # and the inconsistent values are set to zero on copies of the factors.
+  factors = FactorReduction(F, [[v, x] for v, x in E if v not in V])
+  observed = [[v, x] for v, x in E if v in V and x != 0]
+  if observed != []:
+    copies = []
+    for f in factors:
+      f = ToDense(f)
+      factor = Factor()
+      factor.input(f.var, f.card, f.val)
+      copies.append(factor)
+    factors = ObserveEvidence(copies, observed)
+
+  # Factors with few nonzero values are stored sparse, see AutoFactor
+  factors = [AutoFactor(factor) for factor in factors]
+
+  # Variables which have to be summed out
+  card = {}
+  for factor in factors:
+    card.update(zip(factor.var, factor.card))
+  scopes = [factor.var for factor in factors]
+  if order is None:
+    order = EliminationOrder(scopes, card, 'weightedminfill', V)
+
+  # Predict the size of the largest intermediate factor
+  if limit is not None or memoryLimit is not None:
+    cost = EliminationCost(scopes, card, order)
+    batch = np.prod(BatchShape(*factors), dtype=float)
+    CheckFactorSize(cost['maxFactorSize']*batch*8, limit)
+
+  for z in order:
+    # Multiply all factors which contain z and sum z out
+    used = [factor for factor in factors if z in factor.var]
+    factors = [factor for factor in factors if z not in factor.var]
+    if used == []:
+      continue
+    psi = used[0]
+    for factor in used[1:]:
+      psi = AutoFactor(FactorProduct(psi, factor))
+    if len(psi.var) > 1:
+      factors.append(AutoFactor(FactorMarginalization(psi, [z])))
+    # A factor with an empty scope is a constant and is removed by the
+    # renormalization
+
+  # Multiply the remaining factors which are all defined over V, factors
+  # with an empty scope are constants and are dropped
+  factors = [factor for factor in factors if len(factor.var) != 0]
+  M = factors[0]
+  for factor in factors[1:]:
+    M = FactorProduct(M, factor)
+
+  # Returns a renormalized dense factor
+  return RenormalizeFactor(ToDense(M))
+
+
+def InteractionGraph(scopes):
+  """Interaction Graph Connects all variables which share a factor.
+
+  For the conditional probability tables of a Bayesian network, i.e. scopes
+  consisting of a node and its parents, this is the moral graph.
+
+  :Args:
+    - scopes (list): List of factor scopes, each a list of variables
+
+  :Returns:
+    - adjacency (dict): Set of neighbors for each variable
+  """
+  adjacency = {}
+  for scope in scopes:
+    for var in scope:
+      adjacency.setdefault(var, set())
+    for a, b in combinations(scope, 2):
+      if a != b:
+        adjacency[a].add(b)
+        adjacency[b].add(a)
+  return adjacency
+
+
+def EliminationOrder(scopes, card, heuristic='minfill', V=()):
+  """Elimination Order Computes a greedy elimination order.
+
+  ``order = EliminationOrder(scopes, card, heuristic)`` eliminates the
+  variables of the interaction graph of the factor scopes one by one. In each
+  step the variable with the lowest score of the heuristic is chosen, ties are
+  broken by the size of the factor which is created. The heuristics are
+
+    - 'mindegree'         number of neighbors of the variable
+    - 'minfill'           number of edges which have to be added
+    - 'weightedminfill'   sum of the products of the cardinalities of the
+                          variables joined by the added edges
+
+  :Args:
+    - scopes (list): List of factor scopes, each a list of variables
+    - card (dict): Cardinality of each variable
+    - heuristic (str): Name of the heuristic
+    - V (list): Variables which are not eliminated, e.g. the variables of a query
+
+  :Returns:
+    - order (list): Elimination order of the variables which are not in V
+  """
+  if heuristic not in ('mindegree', 'minfill', 'weightedminfill'):
+    raise ValueError('Unknown elimination heuristic: '+str(heuristic))
+  adjacency = InteractionGraph(scopes)
+  keep = set(V)
+
+  def score(var):
+    nb = adjacency[var]
+    weight = float(card[var])
+    for v in nb:
+      weight *= card[v]
+    if heuristic == 'mindegree':
+      return (len(nb), weight)
+    fill = 0
+    for a, b in combinations(nb, 2):
+      if b not in adjacency[a]:
+        fill += card[a]*card[b] if heuristic == 'weightedminfill' else 1
+    return (fill, weight)
+
+  # Priority queue with lazy deletion of outdated scores
+  version = {}
+  heap = []
+  for var in adjacency:
+    if var not in keep:
+      version[var] = len(heap)
+      heap.append((score(var), len(heap), var))
+  heapq.heapify(heap)
+  count = len(heap)
+
+  order = []
+  while heap != []:
+    s, c, var = heapq.heappop(heap)
+    if var not in adjacency or version[var] != c:
+      continue
+    order.append(var)
+    nb = adjacency.pop(var)
+    for a in nb:
+      adjacency[a].discard(var)
+    for a, b in combinations(nb, 2):
+      adjacency[a].add(b)
+      adjacency[b].add(a)
+
+    # Update the scores of all variables whose neighborhood has changed
+    affected = set(nb)
+    if heuristic != 'mindegree':
+      for a in nb:
+        affected.update(adjacency[a])
+    for a in affected:
+      if a not in keep:
+        version[a] = count
+        heapq.heappush(heap, (score(a), count, a))
+        count += 1
+  return order
+
+
+def EliminationCost(scopes, card, order):
+  """Elimination Cost Estimates the cost of a variable elimination.
+
+  ``cost = EliminationCost(scopes, card, order)`` runs the variable
+  elimination of VariableElimination on the scopes of the factors only, i.e.
+  without any values, and reports the size of the intermediate factors.
+
+  :Args:
+    - scopes (list): List of factor scopes, each a list of variables
+    - card (dict): Cardinality of each variable
+    - order (list): Elimination order
+
+  :Returns:
+    - cost (dict): The induced ``width`` (number of variables of the largest intermediate factor minus one), the number of entries of the largest intermediate factor ``maxFactorSize`` and the number of multiplications and additions ``flops``
+  """
+  factors = {}
+  factorsOf = {}
+  for i, scope in enumerate(scopes):
+    if len(scope) != 0:
+      factors[i] = set(scope)
+      for var in scope:
+        factorsOf.setdefault(var, set()).add(i)
+
+  def size(scope):
+    n = 1.0
+    for var in scope:
+      n *= card[var]
+    return n
+
+  width = 0
+  maxFactorSize = 0.0
+  flops = 0.0
+  nextId = len(scopes)
+  for z in order:
+    used = factorsOf.pop(z, set())
+    if used == set():
+      continue
+    scope = set()
+    for i in used:
+      scope.update(factors.pop(i))
+    for var in scope:
+      if var != z:
+        factorsOf[var].difference_update(used)
+    n = size(scope)
+    # len(used)-1 multiplications and one addition per entry
+    flops += n*len(used)
+    width = max(width, len(scope)-1)
+    maxFactorSize = max(maxFactorSize, n)
+    scope.discard(z)
+    if scope != set():
+      factors[nextId] = scope
+      for var in scope:
+        factorsOf[var].add(nextId)
+      nextId += 1
+
+  # Product of the remaining factors
+  if len(factors) > 1:
+    scope = set()
+    for f in factors.values():
+      scope.update(f)
+    n = size(scope)
+    flops += n*(len(factors)-1)
+    width = max(width, len(scope)-1)
+    maxFactorSize = max(maxFactorSize, n)
+  return {'width': width, 'maxFactorSize': maxFactorSize, 'flops': flops}
+
+
+def SetMemoryLimit(limit):
+  """Set the memory limit of the factor operations
+
+  The limit applies to every factor which is created by FactorProduct and
+  to the intermediate factors predicted by VariableElimination.
+
+  :Args:
+    - limit (int): Maximal number of bytes of a single factor, None removes the limit
+  """
+  global memoryLimit
+  memoryLimit = limit
+
+
+def CheckFactorSize(size, limit=None):
+  """Check the predicted size of a factor against the memory limit
+
+  :Args:
+    - size (float): Predicted number of bytes of the factor
+    - limit (int): Memory limit in bytes. The smaller one of this limit and the limit set by SetMemoryLimit is used.
+
+  :Raises:
+    - FactorSizeError: The factor would exceed the memory limit
+  """
+  limits = [l for l in (limit, memoryLimit) if l is not None]
+  if limits != [] and size > min(limits):
+    raise FactorSizeError('Error: Factor of '+str(int(size))+' bytes exceeds the memory limit of '+str(int(min(limits)))+' bytes')
+
+
 def RenormalizeFactor(F):
-  if F.val == np.array([]):
+  if len(F.val) == 0:
     print('Error: Factor is empty')
   else:
-    if np.sum(F.val) != 1:
-      sum = np.sum(F.val)
-      for i in range(len(F.val)):
-        F.val[i] = F.val[i]*sum**(-1)
+    # Batched factors are renormalized row by row
+    F.val = F.val/np.sum(F.val, axis=-1, keepdims=True)
     return F
 
 
@@ -327,14 +851,9 @@ def indices(a, func):
 
 
 def setdiff(a,b):
-    tf = np.in1d(a,b)
-    for i in range(len(tf)):
-      if tf[i] == True:
-        tf[i] = False
-      else:
-        tf[i] = True
-    d = np.setdiff1d(a,b)
-    index = np.array([np.where(a!=b)])[0][0]
+    tf = np.logical_not(np.isin(a,b))
+    index = np.where(tf)[0]
+    d = a[index]
     return d, index
 
 
@@ -352,15 +871,16 @@ def AssignmentToIndex(A, D):
   :Returns:
     - I (list): Returns a list I with indices correlated to the assignment
   """
+  strides = _strides(tuple(np.ravel(D).tolist()))
   if np.any(A.shape==1):
-    I = np.dot(np.cumprod(np.append([1],D[:-1])),(np.reshape(A,-1,order='F')-1))-1
+    I = np.dot(strides,(np.reshape(A,-1,order='F')-1))-1
   else:
-    I = np.sum(np.matlib.repmat(np.cumprod(np.append([1],D[:-1])),A.shape[0],1)*(A-1),1)
+    I = np.dot(A-1, strides)
   return I
 
 
 def ismember(a, b):
-    tf = np.in1d(a,b) # for newer versions of numpy
+    tf = np.isin(a,b) # for newer versions of numpy
     #tf = np.array([i in b for i in a])
     u = np.unique(a[tf])
     index = np.array([(np.where(b == i))[0][-1] if t else 0 for i,t in zip(a,tf)])
@@ -383,13 +903,112 @@ def IndexToAssignment(I,D):
   :Returns:
     - A (list): Returns the assignment A related to the indices I.
   """
-  I = I[np.newaxis].T
-  A = np.mod(np.floor(np.matlib.repmat(I, 1,len(D)) / np.matlib.repmat(np.cumprod(np.append([1],D[:-1])), len(I),1)), np.matlib.repmat(D,len(I),1))+1
+  D = tuple(np.ravel(D).tolist())
+  I = np.asarray(I)[:, np.newaxis]
+  A = np.floor_divide(I, _strides(D)) % np.array(D)+1
   return A
 
 
+def FactorArray(F, var):
+  """Returns the values of a factor as n-d array aligned to given variables
+
+  The axes of the array follow the order of var. Variables of var which are
+  not in the factor get an axis of length one, so the arrays of several
+  factors can be combined by broadcasting. No values are copied. The array of
+  a batched factor has the batch as additional leading axis, the array of an
+  unbatched factor gets a leading axis of length one.
+
+  :Args:
+    - F (Factor): Factor F
+    - var (list): Variables defining the axes, F.var has to be a subset of var
+
+  :Returns:
+    - A (array): Values of F as n-d array with len(var)+1 axes
+  """
+  card = tuple(F.card.tolist())
+  axes, shape = _alignmentPlan(tuple(F.var.tolist()), card, tuple(np.ravel(var).tolist()))
+  batch = BatchShape(F)
+  A = np.reshape(F.val, batch+card, order='F')
+  A = np.transpose(A, tuple(range(len(batch)))+tuple(axis+len(batch) for axis in axes))
+  return np.reshape(A, batch[:1]+(1,)*(1-len(batch))+shape)
+
+
+def BatchShape(*F):
+  """Returns the shape of the batch axis of one or more factors
+
+  :Args:
+    - F (Factor): Factors
+
+  :Returns:
+    - shape (tuple): ``(N,)`` if one of the factors is batched over N cases, otherwise ``()``
+  """
+  for factor in F:
+    if np.ndim(factor.val) == 2:
+      return (np.shape(factor.val)[0],)
+  return ()
+
+
 def intersect(a, b):
   return list(set(a) & set(b))
 
 
+# The plans below only depend on the scopes and cardinalities of the
+# factors, which recur in every query. They are computed once and kept in
+# least recently used caches of at most planCacheSize entries each, the size
+# is read when the module is imported. The arguments are tuples and the
+# results are tuples or read-only arrays, so that the cached plans can't be
+# modified by the callers.
+
+def _assignments(F):
+  """Returns the zero based assignments of the nonzero values of a sparse factor"""
+  card = tuple(F.card.tolist())
+  return np.floor_divide(F.idx[:, np.newaxis], _strides(card)) % np.array(card, dtype=np.int64)
+
+
+@lru_cache(maxsize=planCacheSize)
+def _strides(card):
+  """Returns the strides of the values of a factor with cardinalities card"""
+  strides = np.cumprod((1,)+card)[:-1]
+  strides.flags.writeable = False
+  return strides
+
+
+@lru_cache(maxsize=planCacheSize)
+def _productPlan(varA, cardA, varB, cardB):
+  """Returns the variables and cardinalities of the product of two factors
+
+  The variables are sorted. The third entry tells whether a variable has
+  different cardinalities in the two factors.
+  """
+  card = dict(zip(varB, cardB))
+  mismatch = any(card.get(v, c) != c for v, c in zip(varA, cardA))
+  card.update(zip(varA, cardA))
+  var = tuple(sorted(card))
+  return var, tuple(card[v] for v in var), mismatch
+
+
+@lru_cache(maxsize=planCacheSize)
+def _marginalizationPlan(var, V):
+  """Returns the positions of the variables kept and of the axes summed out"""
+  V = set(V)
+  keep = tuple(i for i, v in enumerate(var) if v not in V)
+  axes = tuple(i for i, v in enumerate(var) if v in V)
+  return keep, axes
+
+
+@lru_cache(maxsize=planCacheSize)
+def _alignmentPlan(var, card, target):
+  """Returns the axis permutation and shape which align a factor to target
+
+  The axes of the factor are transposed into the order of target and
+  variables of target which are not in the factor get an axis of length one.
+  """
+  pos = [target.index(v) for v in var]
+  axes = tuple(int(axis) for axis in np.argsort(pos))
+  shape = [1]*len(target)
+  for p, c in zip(pos, card):
+    shape[p] = c
+  return axes, tuple(shape)
+
+
 
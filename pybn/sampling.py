@@ -0,0 +1,660 @@
+#!/usr/bin/python -tt
+# -*- coding: utf-8 -*-
+
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from .compiled import *
+
+# Number of sampled states which are held in memory at once
+sampleBlockSize = 2**23
+
+def SampleStates(cumulative, rows, u):
+  """Draw one state for each sample by inverting the cumulative distributions
+
+  :Args:
+    - cumulative (array): Cumulative distributions, one row per configuration of the parents
+    - rows (array): Row of the cumulative distribution of each of the N samples
+    - u (array): N uniform random numbers in [0,1)
+
+  :Returns:
+    - states (array): Drawn states, starting with 0
+  """
+  states = np.zeros(len(rows), dtype=np.intp)
+  for k in range(cumulative.shape[1]-1):
+    states += cumulative[rows, k] <= u
+  return states
+
+
+def SamplingTables(compiled):
+  """Returns the tables of the nodes which are used for sampling
+
+  :Args:
+    - compiled (CompiledNetwork): Compiled network
+
+  :Returns:
+    - cpts, cumulative, parents (tuple): Lists with the conditional probability table of each node as 2-d array with one row per configuration of the parents, the cumulative distributions along the rows and the positions of the parents
+  """
+  cpts = []
+  cumulative = []
+  parents = []
+  for i in range(len(compiled)):
+    cpt = compiled.getCpt(i).reshape(-1, compiled.card[i])
+    cpts.append(cpt)
+    cumulative.append(np.cumsum(cpt, axis=1))
+    parents.append(compiled.getParents(i))
+  return cpts, cumulative, parents
+
+
+def ParentRows(card, parents, states):
+  """Returns the row of a conditional probability table for each sample
+
+  :Args:
+    - card (array): Number of outcomes of each node
+    - parents (array): Positions of the parents of the node
+    - states (array): n-by-N array with the sampled states of the n nodes in N samples
+
+  :Returns:
+    - rows (array): Index of the configuration of the parents in each sample, in the GeNIe order of CompiledNetwork.getCpt
+  """
+  rows = np.zeros(states.shape[1], dtype=np.intp)
+  for j in parents:
+    rows *= card[j]
+    rows += states[j]
+  return rows
+
+
+def ForwardSample(compiled, N, rng, observed=None, tables=None, proposal=None, dtype=np.intp):
+  """Draw samples of all nodes in topological order
+
+  The nodes are drawn from their conditional probability tables or, if
+  given, from the tables of a proposal distribution. The weight of a sample
+  is the ratio of its probability and its probability under the proposal.
+
+  :Args:
+    - compiled (CompiledNetwork): Compiled network
+    - N (int): Number of samples
+    - rng (Generator): Random number generator
+    - observed (dict): Observed state, starting with 0, for the positions of the observed nodes. The observed nodes are not sampled but weighted.
+    - tables (tuple): Tables of the network, see SamplingTables
+    - proposal (dict): Table of the proposal and its cumulative distributions for the positions of some unobserved nodes, in the layout of SamplingTables
+    - dtype (dtype): Integer type of the states
+
+  :Returns:
+    - states, weights (tuple): n-by-N array with the states of the nodes, starting with 0, and the importance weight of each sample
+  """
+  if observed is None:
+    observed = {}
+  if tables is None:
+    tables = SamplingTables(compiled)
+  if proposal is None:
+    proposal = {}
+  cpts, cumulative, parents = tables
+  states = np.zeros((len(compiled), N), dtype=dtype)
+  weights = np.ones(N)
+  for i in compiled.order:
+    rows = ParentRows(compiled.card, parents[i], states)
+    if i in observed:
+      states[i] = observed[i]
+      weights *= cpts[i][rows, observed[i]]
+    elif i in proposal:
+      Q, cumulativeQ = proposal[i]
+      states[i] = SampleStates(cumulativeQ, rows, rng.random(N))
+      weights *= cpts[i][rows, states[i]]/Q[rows, states[i]]
+    else:
+      states[i] = SampleStates(cumulative[i], rows, rng.random(N))
+  return states, weights
+
+
+def ObservedStates(evidence):
+  """Returns the observed states of the evidence
+
+  :Args:
+    - evidence (list): List of variable/value pairs, the variable of node i is i+1, see CompiledNetwork.getEvidence
+
+  :Returns:
+    - observed (dict): Observed state, starting with 0, for the position of each observed node
+  """
+  observed = {}
+  if evidence is not None:
+    for var, val in evidence:
+      if val != 0:
+        observed[var-1] = val-1
+  return observed
+
+
+def LikelihoodWeighting(compiled, evidence=None, samples=10000, seed=None):
+  """Estimate the beliefs of all nodes by likelihood weighting
+
+  The nodes are sampled in topological order, all samples of a node at once
+  from the rows of its conditional probability table which are selected by
+  the sampled states of its parents. Observed nodes are set to the observed
+  stage and the weight of each sample is multiplied by the probability of
+  this stage. The samples are drawn in blocks of at most sampleBlockSize
+  states, i.e. the memory doesn't grow with the number of samples.
+
+  The standard errors follow from the weights by the delta method. They
+  are only meaningful if the effective sample size of the weights, see
+  WeightedCounts.getESS, is large. If a few samples carry nearly all the
+  weight, the errors are close to zero although the beliefs are not
+  reliable.
+
+  :Args:
+    - compiled (CompiledNetwork): Compiled network
+    - evidence (list): List of variable/value pairs, the variable of node i is i+1, see CompiledNetwork.getEvidence
+    - samples (int): Number of samples
+    - seed (int): Seed of the random number generator
+
+  :Returns:
+    - beliefs, errors (tuple): Beliefs of the nodes in the order of the network and the estimated standard error of each belief
+
+  :Raises:
+    - ValueError: All samples have the weight zero, i.e. the evidence is impossible or too unlikely for the number of samples
+  """
+  n = len(compiled)
+  observed = ObservedStates(evidence)
+  rng = np.random.default_rng(seed)
+  block = max(1, min(samples, sampleBlockSize // max(n, 1)))
+
+  estimate = WeightedCounts(compiled.card)
+  tables = SamplingTables(compiled)
+  for start in range(0, samples, block):
+    states, weights = ForwardSample(compiled, min(block, samples-start), rng, observed, tables)
+    estimate.add(states, weights)
+  return estimate.getBeliefs(observed)
+
+
+class WeightedCounts(object):
+  """Weighted counts of the states of all nodes in weighted samples
+
+  Keeps the weighted counts, the counts weighted by the squared weights and
+  the sums of the weights, from which the beliefs and their standard errors
+  follow without storing the samples.
+
+  :Attributes:
+    - card (array): Number of outcomes of each node
+    - samples (int): Number of added samples
+  """
+
+  def __init__(self, card):
+    self.card = card
+    self.counts = [np.zeros(m) for m in card]
+    self.squares = [np.zeros(m) for m in card]
+    self.total = 0.0
+    self.totalSquares = 0.0
+    self.samples = 0
+
+  def add(self, states, weights):
+    """Add weighted samples
+
+    :Args:
+      - states (array): n-by-N array with the states of the nodes, starting with 0
+      - weights (array): Weight of each of the N samples
+    """
+    squaredWeights = weights**2
+    for i, m in enumerate(self.card):
+      self.counts[i] += np.bincount(states[i], weights=weights, minlength=m)
+      self.squares[i] += np.bincount(states[i], weights=squaredWeights, minlength=m)
+    self.total += np.sum(weights)
+    self.totalSquares += np.sum(squaredWeights)
+    self.samples += len(weights)
+
+  def getESS(self):
+    """Returns Kish's effective sample size of the weights
+
+    The effective sample size (sum of the weights)^2/(sum of the squared
+    weights) is the number of samples, if all weights are equal, and 1, if
+    one sample carries all the weight.
+
+    :Returns:
+      - ess (float): Effective sample size, 0 if all samples have the weight zero
+    """
+    if self.totalSquares == 0:
+      return 0.0
+    return float(self.total**2/self.totalSquares)
+
+  def getBeliefs(self, observed=None):
+    """Returns the estimated beliefs and their standard errors
+
+    :Args:
+      - observed (dict): Observed states, whose beliefs are exact, see ObservedStates
+
+    :Returns:
+      - beliefs, errors (tuple): Beliefs of the nodes and the estimated standard error of each belief
+
+    :Raises:
+      - ValueError: All samples have the weight zero, i.e. the evidence is impossible or too unlikely for the number of samples
+    """
+    if self.total == 0:
+      raise ValueError('Error: All samples have the weight zero, the evidence is impossible or too unlikely')
+    beliefs = []
+    errors = []
+    for i in range(len(self.card)):
+      p = self.counts[i]/self.total
+      # Delta method for the ratio of the weighted counts and the total weight
+      variance = (1-2*p)*self.squares[i]+p**2*self.totalSquares
+      if observed is not None and i in observed:
+        variance = np.zeros(len(p))
+      beliefs.append(p)
+      errors.append(np.sqrt(np.maximum(variance, 0))/self.total)
+    return beliefs, errors
+
+
+def AdaptiveImportanceSampling(compiled, evidence=None, samples=1000000, seed=None, precision=0.01, batch=1000, updates=10, threshold=0.04, rates=(0.4, 0.14), minESS=100):
+  """Estimate the beliefs of all nodes by adaptive importance sampling
+
+  Likelihood weighting samples the nodes from their prior distribution, so
+  with unlikely evidence nearly all samples get a negligible weight. The
+  adaptive importance sampling (AIS-BN) learns a proposal distribution which
+  approaches the posterior distribution instead. Only the tables of the
+  unobserved ancestors of the observed nodes are learned, all other nodes
+  are sampled from their prior distribution.
+
+  The proposal starts from the conditional probability tables, where the
+  parents of the observed nodes are uniform and probabilities smaller than
+  the threshold are raised to it. For each of the updates a batch of samples
+  is drawn, and the proposal is moved towards the distribution of the
+  weighted samples with a learning rate, which decreases from rates[0] to
+  rates[1]. Afterwards batches are drawn from the learned proposal until the
+  largest standard error of the beliefs is at most the precision or the
+  number of samples is reached. Only these batches enter the estimate. The
+  standard errors are only trusted once the effective sample size of the
+  weights is at least minESS, because with few effective samples they are
+  close to zero, see WeightedCounts.getESS.
+
+  :Args:
+    - compiled (CompiledNetwork): Compiled network
+    - evidence (list): List of variable/value pairs, see CompiledNetwork.getEvidence
+    - samples (int): Maximal number of samples of the estimate
+    - seed (int): Seed of the random number generator
+    - precision (float): Largest standard error of the beliefs at which the sampling stops
+    - batch (int): Number of samples of each batch
+    - updates (int): Number of updates of the proposal
+    - threshold (float): Smallest probability of the initial proposal, for nodes with many outcomes at most half the uniform probability
+    - rates (tuple): Learning rate of the first and the last update
+    - minESS (float): Smallest effective sample size at which the precision is tested
+
+  :Returns:
+    - beliefs, errors, diagnostics (tuple): Beliefs of the nodes in the order of the network, the estimated standard error of each belief and a dict with the number of ``samples`` of the estimate, its effective sample size ``ess`` and whether the ``precision`` is reached
+
+  :Raises:
+    - ValueError: All samples have the weight zero, i.e. the evidence is impossible or too unlikely
+  """
+  observed = ObservedStates(evidence)
+  rng = np.random.default_rng(seed)
+  tables = SamplingTables(compiled)
+  cpts = tables[0]
+
+  # Unobserved ancestors of the observed nodes
+  parents = set(j for i in observed for j in compiled.getParents(i))
+  ancestors = set()
+  stack = list(observed)
+  while stack != []:
+    for j in compiled.getParents(stack.pop()):
+      if j not in ancestors and j not in observed:
+        ancestors.add(j)
+        stack.append(j)
+
+  proposal = {}
+  for i in ancestors:
+    m = compiled.card[i]
+    Q = np.array(cpts[i], dtype=float)
+    if i in parents:
+      Q[:] = 1.0/m
+    Q = np.maximum(Q, min(threshold, 0.5/m))
+    Q /= np.sum(Q, axis=1)[:,None]
+    proposal[i] = (Q, np.cumsum(Q, axis=1))
+
+  for k in range(updates):
+    states, weights = ForwardSample(compiled, batch, rng, observed, tables, proposal)
+    if np.sum(weights) == 0:
+      continue
+    rate = rates[0]*(rates[1]/rates[0])**(k/max(updates-1, 1))
+    for i, (Q, cumulativeQ) in proposal.items():
+      m = compiled.card[i]
+      rows = ParentRows(compiled.card, compiled.getParents(i), states)
+      counts = np.bincount(rows*m+states[i], weights=weights, minlength=Q.size).reshape(Q.shape)
+      total = np.sum(counts, axis=1)
+      # Rows of parent configurations without weighted samples are kept
+      seen = total > 0
+      Q = Q.copy()
+      Q[seen] += rate*(counts[seen]/total[seen][:,None]-Q[seen])
+      proposal[i] = (Q, np.cumsum(Q, axis=1))
+
+  estimate = WeightedCounts(compiled.card)
+  converged = False
+  while estimate.samples < samples and not converged:
+    states, weights = ForwardSample(compiled, min(batch, samples-estimate.samples), rng, observed, tables, proposal)
+    estimate.add(states, weights)
+    if estimate.total > 0 and estimate.getESS() >= minESS:
+      beliefs, errors = estimate.getBeliefs(observed)
+      converged = bool(max(np.max(e) for e in errors) <= precision)
+  beliefs, errors = estimate.getBeliefs(observed)
+  return beliefs, errors, {'samples': estimate.samples, 'ess': estimate.getESS(), 'precision': converged}
+
+
+def SampleChunks(compiled, samples, chunk_size=65536, seed=None):
+  """Draw joint samples of all nodes by ancestral sampling in chunks
+
+  The chunks are drawn one after another, i.e. only one chunk is held in
+  memory. The random numbers of chunk k are drawn from the k-th child of
+  the seed sequence, so a chunk is reproduced by the seed and its number
+  alone, independent of the chunk size of the other chunks.
+
+  :Args:
+    - compiled (CompiledNetwork): Compiled network
+    - samples (int): Number of samples
+    - chunk_size (int): Number of samples per chunk
+    - seed (int): Seed of the random number generator
+
+  :Returns:
+    - chunks (generator): Arrays with one sample per row and one column per node in the order of the network, the states start with 0. The smallest signed integer type which holds the states is used.
+  """
+  root = np.random.SeedSequence(seed)
+  dtype = np.min_scalar_type(-int(np.max(compiled.card, initial=1)))
+  tables = SamplingTables(compiled)
+  for k, start in enumerate(range(0, samples, chunk_size)):
+    rng = np.random.default_rng(np.random.SeedSequence(root.entropy, spawn_key=(k,)))
+    states, weights = ForwardSample(compiled, min(chunk_size, samples-start), rng, tables=tables, dtype=dtype)
+    yield np.ascontiguousarray(states.T)
+
+
+def WriteSamples(compiled, filename, samples, chunk_size=65536, seed=None):
+  """Write joint samples of all nodes to a file, see SampleChunks
+
+  The samples are written chunk by chunk, i.e. the memory doesn't grow with
+  the number of samples. A name ending with .npy is written as NumPy array
+  with one sample per row, any other name as CSV file with the names of the
+  nodes in the first line.
+
+  :Args:
+    - compiled (CompiledNetwork): Compiled network
+    - filename (str): Name of the file
+    - samples (int): Number of samples
+    - chunk_size (int): Number of samples per chunk
+    - seed (int): Seed of the random number generator
+  """
+  chunks = SampleChunks(compiled, samples, chunk_size, seed)
+  if filename.endswith('.npy'):
+    dtype = np.min_scalar_type(-int(np.max(compiled.card, initial=1)))
+    header = {'descr': np.lib.format.dtype_to_descr(dtype), 'fortran_order': False, 'shape': (samples, len(compiled))}
+    with open(filename, 'wb') as f:
+      np.lib.format.write_array_header_2_0(f, header)
+      for chunk in chunks:
+        f.write(chunk.tobytes())
+  else:
+    with open(filename, 'w') as f:
+      f.write(','.join(compiled.names)+'\n')
+      for chunk in chunks:
+        np.savetxt(f, chunk, fmt='%d', delimiter=',')
+
+
+def ParentStrides(compiled):
+  """Returns the stride of each parent in the rows of the table of its child
+
+  :Args:
+    - compiled (CompiledNetwork): Compiled network
+
+  :Returns:
+    - strides (array): Stride of the parent compiled.indices[k] in the table of its child, see ParentRows
+  """
+  strides = np.ones(len(compiled.indices), dtype=np.intp)
+  for c in range(len(compiled)):
+    stride = 1
+    for k in range(compiled.indptr[c+1]-1, compiled.indptr[c]-1, -1):
+      strides[k] = stride
+      stride *= compiled.card[compiled.indices[k]]
+  return strides
+
+
+def MarkovBlankets(compiled):
+  """Returns the Markov blanket of each node
+
+  :Args:
+    - compiled (CompiledNetwork): Compiled network
+
+  :Returns:
+    - blankets (list): Set of the parents, children and parents of the children of each node
+  """
+  blankets = [set() for i in range(len(compiled))]
+  for c in range(len(compiled)):
+    family = [c]+list(compiled.getParents(c))
+    for i in family:
+      blankets[i].update(family)
+  for i in range(len(compiled)):
+    blankets[i].discard(i)
+  return blankets
+
+
+def ChromaticClasses(compiled, nodes):
+  """Partition nodes into classes without two nodes in one Markov blanket
+
+  The nodes of a class are independent given all other nodes, i.e. they can
+  be updated at once by a Gibbs sampler. The classes are found by a greedy
+  colouring of the moral graph, the nodes with the largest blankets first.
+
+  :Args:
+    - compiled (CompiledNetwork): Compiled network
+    - nodes (list): Positions of the nodes
+
+  :Returns:
+    - classes (list): Arrays with the positions of the nodes of each class
+  """
+  blankets = MarkovBlankets(compiled)
+  colour = {}
+  for i in sorted(nodes, key=lambda i: -len(blankets[i])):
+    used = set(colour[j] for j in blankets[i] if j in colour)
+    c = 0
+    while c in used:
+      c += 1
+    colour[i] = c
+  classes = [[] for c in range(max(colour.values())+1 if colour else 0)]
+  for i in nodes:
+    classes[colour[i]].append(i)
+  return [np.array(nodes, dtype=np.intp) for nodes in classes]
+
+
+def GibbsTerms(compiled, nodes, strides):
+  """Returns the table entries of the full conditionals of a class of nodes
+
+  The full conditional of node i in state k is the product of the entry of
+  its own table and the entries of the tables of its children. For a table
+  of node f, the entry in the current states is
+  offsets[f]+rows[f]*card[f]+states[f], and changing node i to state k moves
+  it by the multiplier of the term times k-states[i].
+
+  :Args:
+    - compiled (CompiledNetwork): Compiled network
+    - nodes (array): Positions of the nodes of the class
+    - strides (array): Strides of the parents, see ParentStrides
+
+  :Returns:
+    - terms (tuple): Arrays with the table node f, the varied node i, the state k and the multiplier of each term, the start of the terms of each candidate state and the start of the candidate states of each node
+  """
+  children = [[] for i in range(len(compiled))]
+  for c in range(len(compiled)):
+    for k in range(compiled.indptr[c], compiled.indptr[c+1]):
+      children[compiled.indices[k]].append((c, strides[k]*compiled.card[c]))
+
+  f, v, states, multipliers, starts, nodeStarts = [], [], [], [], [], []
+  for i in nodes:
+    nodeStarts.append(len(starts))
+    for k in range(compiled.card[i]):
+      starts.append(len(f))
+      for c, multiplier in [(i, 1)]+children[i]:
+        f.append(c)
+        v.append(i)
+        states.append(k)
+        multipliers.append(multiplier)
+  return tuple(np.array(a, dtype=np.intp) for a in (f, v, states, multipliers, starts, nodeStarts))
+
+
+def GibbsChains(network, observed, chains, sweeps, burnin, batches, seed):
+  """Run Gibbs chains and count the visited states
+
+  The unobserved nodes are partitioned into classes of nodes which are
+  independent given the others, see ChromaticClasses. Each sweep updates the
+  classes in turn, all nodes of a class in all chains by one vectorised
+  step. The full conditionals are the products of the table entries of the
+  Markov blankets, see GibbsTerms. The chains are started from forward
+  samples which are consistent with the evidence.
+
+  :Args:
+    - network (CompiledNetwork or SharedNetwork): Compiled network or the handle of a shared one
+    - observed (dict): Observed states, see ObservedStates
+    - chains (int): Number of chains
+    - sweeps (int): Number of sweeps over all nodes which are counted, a multiple of batches
+    - burnin (int): Number of sweeps which are discarded
+    - batches (int): Number of batches of the counted sweeps
+    - seed (SeedSequence): Seed of the random number generator
+
+  :Returns:
+    - counts (array): chains-by-batches-by-K array with the number of sweeps in which each of the K states of all nodes is visited, the states of node i start at the offset sum(card[:i])
+
+  :Raises:
+    - ValueError: No forward sample is consistent with the evidence
+  """
+  if isinstance(network, SharedNetwork):
+    network = network.attach()
+  n = len(network)
+  card = network.card
+  rng = np.random.default_rng(seed)
+
+  # Start with forward samples drawn by their likelihood
+  states, weights = ForwardSample(network, max(100, 10*chains), rng, observed)
+  if np.sum(weights) == 0:
+    raise ValueError('Error: No sample is consistent with the evidence, the evidence is impossible or too unlikely')
+  states = states[:, rng.choice(len(weights), size=chains, p=weights/np.sum(weights))]
+
+  strides = ParentStrides(network)
+  withParents = np.nonzero(np.diff(network.indptr) > 0)[0]
+  unobserved = [i for i in network.order if i not in observed]
+  classes = []
+  for nodes in ChromaticClasses(network, unobserved):
+    # Node of each candidate state of the class
+    node = np.repeat(np.arange(len(nodes)), card[nodes])
+    classes.append((nodes, node, GibbsTerms(network, nodes, strides)))
+
+  offsets = np.zeros(n, dtype=np.intp)
+  np.cumsum(card[:-1], out=offsets[1:])
+  K = int(np.sum(card))
+  positions = offsets[:,None]+np.arange(chains)*K
+  counts = np.zeros((chains, batches, K))
+  length = sweeps // batches
+  rows = np.zeros((n, chains), dtype=np.intp)
+  for sweep in range(burnin+sweeps):
+    for nodes, node, (f, v, k, multipliers, starts, nodeStarts) in classes:
+      # Rows of all tables in the current states
+      if len(withParents) > 0:
+        rows[withParents] = np.add.reduceat(strides[:,None]*states[network.indices], network.indptr[withParents], axis=0)
+      entries = (network.offsets[f][:,None]+rows[f]*card[f][:,None]+states[f]
+                 +multipliers[:,None]*(k[:,None]-states[v]))
+      P = np.multiply.reduceat(network.values[entries], starts, axis=0)
+      total = np.add.reduceat(P, nodeStarts, axis=0)
+      P = np.divide(P, total[node], out=np.zeros_like(P), where=total[node] > 0)
+      cdf = np.cumsum(P, axis=0)
+      within = cdf-(cdf-P)[nodeStarts][node]
+      drawn = np.add.reduceat(within <= rng.random((len(nodes), chains))[node], nodeStarts, axis=0, dtype=np.intp)
+      # A state without support in the blanket is kept
+      states[nodes] = np.where(total > 0, np.minimum(drawn, card[nodes][:,None]-1), states[nodes])
+    if sweep >= burnin:
+      batch = (sweep-burnin) // length
+      counts[:,batch,:] += np.bincount(np.ravel(positions+states), minlength=chains*K).reshape(chains, K)
+  return counts
+
+
+def ChainDiagnostics(counts, length):
+  """Estimate the beliefs and the convergence diagnostics from the counts of chains
+
+  The within and between chain variances of the indicator of each state give
+  the potential scale reduction factor R-hat. The variance of the batch
+  means gives the Monte Carlo standard error and the effective sample size.
+
+  :Args:
+    - counts (array): chains-by-batches-by-K array of counts, see GibbsChains
+    - length (int): Number of sweeps per batch
+
+  :Returns:
+    - p, errors, rhat, ess (tuple): Estimated probability, standard error, R-hat and effective sample size for each of the K states
+  """
+  chains, batches, K = counts.shape
+  n = batches*length
+  means = np.sum(counts, axis=1)/n
+  p = np.mean(means, axis=0)
+  # The variance of an indicator follows from its mean
+  within = np.mean(means*(1-means), axis=0)*n/max(n-1, 1)
+  between = n*np.var(means, axis=0, ddof=1) if chains > 1 else np.zeros(K)
+  pooled = (n-1)/n*within+between/n
+  with np.errstate(divide='ignore', invalid='ignore'):
+    rhat = np.where(within > 0, np.sqrt(pooled/within), np.where(between > 0, np.inf, 1.0))
+    batchVariance = length*np.mean(np.var(counts/length, axis=1, ddof=1), axis=0) if batches > 1 else within
+    ess = np.where(batchVariance > 0, chains*n*within/batchVariance, chains*n)
+  ess = np.minimum(ess, chains*n)
+  errors = np.sqrt(batchVariance/(chains*n))
+  return p, errors, rhat, ess
+
+
+def GibbsSampling(compiled, evidence=None, samples=10000, seed=None, chains=4, burnin=None, batches=20, processes=None):
+  """Estimate the beliefs of all nodes by Gibbs sampling
+
+  The chains are distributed over a pool of processes, which attach to a
+  copy of the compiled network in shared memory, see CompiledNetwork.share.
+  Each process runs its chains at once, see GibbsChains. The memory doesn't
+  grow with the number of samples, only the counts of the states in each
+  batch are kept.
+
+  Gibbs sampling only needs the tables of the Markov blanket of a node, i.e.
+  it works on networks whose exact factors don't fit into memory. The chains
+  mix badly if the network contains deterministic relations, which is shown
+  by the diagnostics.
+
+  :Args:
+    - compiled (CompiledNetwork): Compiled network
+    - evidence (list): List of variable/value pairs, see CompiledNetwork.getEvidence
+    - samples (int): Number of counted samples of all chains
+    - seed (int): Seed of the random number generator
+    - chains (int): Number of chains
+    - burnin (int): Number of discarded sweeps of each chain, by default a tenth of the counted sweeps
+    - batches (int): Number of batches of each chain for the standard errors
+    - processes (int): Number of processes, by default one per chain up to the number of CPUs. With one process the chains run in the calling process.
+
+  :Returns:
+    - beliefs, errors, diagnostics (tuple): Beliefs of the nodes in the order of the network, the estimated standard error of each belief and a dict with the largest ``rhat`` and the smallest effective sample size ``ess`` of the states of each node
+  """
+  observed = ObservedStates(evidence)
+  batches = max(1, batches)
+  length = max(1, -(-samples // (chains*batches)))
+  sweeps = length*batches
+  if burnin is None:
+    burnin = sweeps // 10
+  if processes is None:
+    processes = min(chains, os.cpu_count() or 1)
+  processes = max(1, min(processes, chains))
+  groups = [len(group) for group in np.array_split(np.arange(chains), processes)]
+  seeds = np.random.SeedSequence(seed).spawn(processes)
+
+  if processes == 1:
+    counts = GibbsChains(compiled, observed, chains, sweeps, burnin, batches, seeds[0])
+  else:
+    shared = CompiledNetwork(compiled.names, compiled.card, compiled.indptr, compiled.indices, compiled.offsets, compiled.values)
+    handle = shared.share()
+    try:
+      with ProcessPoolExecutor(processes) as pool:
+        futures = [pool.submit(GibbsChains, handle, observed, k, sweeps, burnin, batches, s) for k, s in zip(groups, seeds)]
+        counts = np.concatenate([future.result() for future in futures])
+    finally:
+      handle.unlink()
+
+  p, errors, rhat, ess = ChainDiagnostics(counts, length)
+  beliefs = []
+  beliefErrors = []
+  diagnostics = {'rhat': [], 'ess': []}
+  start = 0
+  for i in range(len(compiled)):
+    end = start+compiled.card[i]
+    beliefs.append(p[start:end])
+    beliefErrors.append(errors[start:end])
+    diagnostics['rhat'].append(float(np.max(rhat[start:end])))
+    diagnostics['ess'].append(float(np.min(ess[start:end])))
+    start = end
+  return beliefs, beliefErrors, diagnostics
@@ -0,0 +1,179 @@
+#!/usr/bin/python -tt
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import numpy as np
+from collections import OrderedDict
+from .network import *
+from .xdsl import *
+
+# Version of the binary format
+formatVersion = 2
+
+def SaveNetwork(network, directory):
+  """Save a network in the binary format
+
+  The network is stored in a directory. The structure of the network, i.e.
+  the outcomes, parents and layout of the nodes, is written to the header
+  ``network.json`` and the tables of all nodes to three .npy files. The
+  tables of the Nodes are stored in the order in which the inference reads
+  them: ``values.npy`` holds them in the order of setProbabilities and in
+  the layout of CompiledNetwork.values, ``factors.npy`` in the order of the
+  factors, see CompiledNetwork.getFactorValues. ``parameters.npy`` holds the
+  parameters of all parents of each NoisyMaxNode followed by its leak. The
+  entry of a node in the header gives the start and stop of its table.
+
+  :Args:
+    - network (Network): Bayesian network
+    - directory (str): Name of the directory, which is created if it doesn't exist
+  """
+  if not os.path.isdir(directory):
+    os.makedirs(directory)
+  header = {'version': formatVersion, 'name': network.name, 'nodes': []}
+  sizes = {'cpt': 0, 'noisymax': 0}
+  for node in network.nodes:
+    if isinstance(node, NoisyMaxNode):
+      kind = 'noisymax'
+      size = sum(np.size(parameter) for parameter in node.getParameters())+np.size(node.getLeak())
+    else:
+      kind = 'cpt'
+      size = np.size(node.getProbabilities())
+    header['nodes'].append({
+      'name': node.name,
+      'type': kind,
+      'outcomes': node.getOutcomes(),
+      'parents': [connection[0] for connection in node.getArcConnection()],
+      'start': sizes[kind],
+      'stop': sizes[kind]+int(size),
+      'caption': node.caption,
+      'interior_color': node.interior_color,
+      'outline_color': node.outline_color,
+      'font_color': node.font_color,
+      'font_name': node.font_name,
+      'font_size': node.font_size,
+      'node_size': [int(x) for x in node.node_size],
+      'node_position': [int(x) for x in node.node_position],
+      'bar_active': node.bar_active,
+      })
+    sizes[kind] += int(size)
+
+  # The tables are written node by node into the mapped files, i.e. the
+  # network is never held twice in memory
+  files = {}
+  for name, kind in (('values', 'cpt'), ('factors', 'cpt'), ('parameters', 'noisymax')):
+    files[name] = np.lib.format.open_memmap(os.path.join(directory, name+'.npy'), mode='w+', dtype=float, shape=(sizes[kind],))
+  for entry, node in zip(header['nodes'], network.nodes):
+    if entry['type'] == 'noisymax':
+      values = np.concatenate([np.ravel(parameter) for parameter in node.getParameters()]+[np.ravel(node.getLeak())])
+      files['parameters'][entry['start']:entry['stop']] = values
+    else:
+      files['values'][entry['start']:entry['stop']] = np.ravel(node.getProbabilities())
+      files['factors'][entry['start']:entry['stop']] = node.transformProbabilities()
+  for values in files.values():
+    values.flush()
+  del files
+  with open(os.path.join(directory, 'network.json'), 'w') as f:
+    json.dump(header, f, indent=1)
+
+
+def LoadNetwork(directory, mmap=True):
+  """Load a network from the binary format, see SaveNetwork
+
+  The tables are memory-mapped read-only, i.e. loading a network only reads
+  the header. The pages of a table are read when the table is used, and are
+  shared through the page cache by all processes which load the same network.
+  The probabilities and the factors of the Nodes are views into the mapped
+  files. If the network has no NoisyMaxNode, its compiled network, see
+  Network.compileArrays, uses the mapped files as well, so that no table is
+  copied.
+
+  :Args:
+    - directory (str): Name of the directory
+    - mmap (bool): Map the tables into memory instead of reading them
+
+  :Returns:
+    - network (Network): Bayesian network
+
+  :Raises:
+    - ValueError: The format version of the directory isn't supported or a node refers to an unknown parent
+  """
+  with open(os.path.join(directory, 'network.json')) as f:
+    header = json.load(f)
+  if header.get('version') not in (1, formatVersion):
+    raise ValueError('Error: Format version '+str(header.get('version'))+' of '+directory+' is not supported')
+
+  network = Network(header['name'])
+  # The nodes are created before the arcs, so that the parents of a node
+  # don't have to be saved before the node
+  nodes = OrderedDict()
+  for entry in header['nodes']:
+    if entry['type'] == 'noisymax':
+      node = NoisyMaxNode(entry['name'])
+    else:
+      node = Node(entry['name'])
+    node.addOutcomes(entry['outcomes'])
+    nodes[str(node)] = node
+  for entry in header['nodes']:
+    for name in entry['parents']:
+      if name not in nodes:
+        raise ValueError('Error: Parent '+name+' of '+entry['name']+' is not defined in '+directory)
+      Arc(nodes[name], nodes[entry['name']])
+
+  mode = 'r' if mmap else None
+  files = {}
+  if header['version'] > 1:
+    for name in ('values', 'factors', 'parameters'):
+      files[name] = np.load(os.path.join(directory, name+'.npy'), mmap_mode=mode)
+
+  for entry, node in zip(header['nodes'], nodes.values()):
+    if header['version'] == 1:
+      # One file per node with the table in the order of setProbabilities
+      values = np.load(os.path.join(directory, entry['file']), mmap_mode=mode)
+      factors = None
+    elif entry['type'] == 'noisymax':
+      values = files['parameters'][entry['start']:entry['stop']]
+    else:
+      values = files['values'][entry['start']:entry['stop']]
+      factors = files['factors'][entry['start']:entry['stop']]
+    if entry['type'] == 'noisymax':
+      m = node.getSize()
+      parameters = []
+      start = 0
+      for connection in node.getArcConnection():
+        parameters.append(values[start:start+connection[2]*m])
+        start += connection[2]*m
+      node.setParameters(parameters, values[start:])
+    else:
+      node.setProbabilities(values, factors)
+
+    node.caption = entry['caption']
+    node.setInteriorColor(entry['interior_color'])
+    node.setOutlineColor(entry['outline_color'])
+    node.setFontColor(entry['font_color'])
+    node.setFontName(entry['font_name'])
+    node.setFontSize(entry['font_size'])
+    node.node_size = entry['node_size']
+    node.node_position = entry['node_position']
+    node.setBarActive(entry['bar_active'])
+    network.addNode(node)
+
+  if files != {} and not any(entry['type'] == 'noisymax' for entry in header['nodes']):
+    # The tables of the nodes are stored in the layout of the compiled network
+    network.arrays = CompileNetwork(network, files['values'], files['factors'])
+  return network
+
+
+def load(filename, extensions=True):
+  """Load a network from a file
+
+  :Args:
+    - filename (str): Name of an .xdsl file, which may be gzipped, or of a directory in the binary format, see LoadNetwork
+    - extensions (bool): Read the layout of the nodes of an .xdsl file, see ReadXdsl
+
+  :Returns:
+    - network (Network): Bayesian network
+  """
+  if os.path.isdir(filename):
+    return LoadNetwork(filename)
+  return ReadXdsl(filename, extensions=extensions)
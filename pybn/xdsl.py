@@ -0,0 +1,129 @@
+#!/usr/bin/python -tt
+# -*- coding: utf-8 -*-
+
+import gzip
+import numpy as np
+from xml.etree.ElementTree import iterparse
+from .network import *
+
+def ReadXdsl(filename, network=None, extensions=True):
+  """Read a GeNIe network from an .xdsl file
+
+  The file is parsed incrementally. Each node element is converted into a
+  Node as soon as it is complete and is removed from the parsed tree
+  afterwards, i.e. the memory used by the parser is bounded by the size of
+  one node. The parents of a node have to be defined before the node, as
+  GeNIe writes them. Nodes of the types ``cpt``, ``noisymax`` and
+  ``deterministic`` are supported.
+
+  :Args:
+    - filename (str): Name of the .xdsl file, a name ending with .gz is read as gzip file
+    - network (Network): Network to which the nodes are added. If not given, a new network named by the file is created.
+    - extensions (bool): Read the layout of the nodes from the ``<extensions>`` section. If ``False``, the parser stops at the end of the nodes, which is sufficient for the inference.
+
+  :Returns:
+    - network (Network): Network with the nodes of the file
+
+  :Raises:
+    - ValueError: The file contains an unsupported node type or a node refers to an unknown parent
+  """
+  if isinstance(filename, str) and filename.endswith('.gz'):
+    with gzip.open(filename, 'rb') as f:
+      return ReadXdsl(f, network, extensions)
+
+  nodes = {}
+  stack = []
+  for event, element in iterparse(filename, events=('start', 'end')):
+    if event == 'start':
+      if element.tag == 'smile' and network is None:
+        network = Network(element.get('id'))
+      elif element.tag == 'extensions' and not extensions:
+        break
+      stack.append(element)
+      continue
+
+    stack.pop()
+    if len(stack) == 0:
+      continue
+    if stack[-1].tag == 'nodes':
+      node = _readNode(element, nodes)
+      nodes[str(node)] = node
+      network.addNode(node)
+    elif element.tag == 'node' and element.get('id') in nodes:
+      _readExtension(element, nodes[element.get('id')])
+    else:
+      continue
+    # Remove the converted element from the parsed tree
+    element.clear()
+    stack[-1].remove(element)
+  return network
+
+
+def _readNode(element, nodes):
+  """Create a Node from a complete node element"""
+  states = [state.get('id') for state in element.findall('state')]
+  parents = element.findtext('parents', '').split()
+  for name in parents:
+    if name not in nodes:
+      raise ValueError('Error: Parent '+name+' of '+element.get('id')+' is not defined before the node')
+
+  if element.tag == 'noisymax':
+    node = NoisyMaxNode(element.get('id'))
+  elif element.tag in ('cpt', 'deterministic'):
+    node = Node(element.get('id'))
+  else:
+    raise ValueError('Error: Node type '+element.tag+' of '+str(element.get('id'))+' is not supported')
+  node.addOutcomes(states)
+  for name in parents:
+    Arc(nodes[name], node)
+
+  if element.tag == 'cpt':
+    node.setProbabilities(np.array(element.findtext('probabilities', '').split(), dtype=float))
+  elif element.tag == 'deterministic':
+    resulting = element.findtext('resultingstates', '').split()
+    probabilities = np.zeros((len(resulting), len(states)))
+    probabilities[np.arange(len(resulting)), [states.index(state) for state in resulting]] = 1
+    node.setProbabilities(np.ravel(probabilities))
+  else:
+    # The rows of the parameters of a parent are given in the order of its
+    # strengths and are stored in the order of its outcomes
+    m = len(states)
+    values = np.array(element.findtext('parameters', '').split(), dtype=float)
+    strengths = np.array(element.findtext('strengths', '').split(), dtype=int)
+    parameters = []
+    start = 0
+    for name in parents:
+      c = nodes[name].getSize()
+      block = np.reshape(values[start*m:(start+c)*m], (c, m))
+      parameter = np.empty_like(block)
+      parameter[strengths[start:start+c]] = block
+      parameters.append(parameter)
+      start += c
+    node.setParameters(parameters, values[start*m:])
+  return node
+
+
+def _readExtension(element, node):
+  """Set the layout of a node from its element of the extensions"""
+  if element.find('name') is not None:
+    node.caption = element.findtext('name')
+  interior = element.find('interior')
+  if interior is not None:
+    node.setInteriorColor(interior.get('color'))
+  outline = element.find('outline')
+  if outline is not None:
+    node.setOutlineColor(outline.get('color'))
+  font = element.find('font')
+  if font is not None:
+    node.setFontColor(font.get('color'))
+    node.setFontName(font.get('name'))
+    node.setFontSize(int(font.get('size')))
+  position = element.findtext('position')
+  if position is not None:
+    node.node_position = [int(x) for x in position.split()]
+  barchart = element.find('barchart')
+  if barchart is not None:
+    node.setBarActive(barchart.get('active') == 'true')
+    node.node_size[2] = int(barchart.get('width'))
+    node.node_size[3] = int(barchart.get('height'))
+
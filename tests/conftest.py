@@ -0,0 +1,8 @@
+#!/usr/bin/python -tt
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+
+# The tests use the package of this repository, not an installed one
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
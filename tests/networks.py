@@ -0,0 +1,91 @@
+#!/usr/bin/python -tt
+# -*- coding: utf-8 -*-
+
+import numpy as np
+from pybn import *
+
+def RandomNetwork(n, k=3, card=2, seed=0):
+  """Network of n nodes with up to k random parents and random tables"""
+  rng = np.random.default_rng(seed)
+  network = Network('random')
+  nodes = []
+  for i in range(n):
+    node = Node('N'+str(i))
+    node.addOutcomes(['s'+str(j) for j in range(card)])
+    if i > 0:
+      for p in sorted(rng.choice(i, size=min(i, rng.integers(0, k+1)), replace=False)):
+        Arc(nodes[p], node)
+    m, c = node.getTableSize()
+    node.setProbabilities(rng.dirichlet(np.ones(m), size=c).ravel())
+    nodes.append(node)
+  network.addNodes(nodes)
+  return network
+
+
+def NoisyNetwork(k, m=3, seed=0, noisy=True):
+  """Network of k parents of a noisy-MAX node Y, which has one child Z
+
+  With noisy=False, Y is a Node with the expanded table of the noisy-MAX
+  node instead.
+  """
+  rng = np.random.default_rng(seed)
+  network = Network('noisy')
+  parents = []
+  for i in range(k):
+    parent = Node('P'+str(i))
+    parent.addOutcomes(['s'+str(j) for j in range(2+i%2)])
+    parent.setProbabilities(rng.dirichlet(np.ones(parent.getSize())))
+    parents.append(parent)
+  y = NoisyMaxNode('Y')
+  y.addOutcomes(['y'+str(j) for j in range(m)])
+  for parent in parents:
+    Arc(parent, y)
+  parameters = []
+  for parent in parents:
+    table = rng.dirichlet(np.ones(m), size=parent.getSize())
+    # The last state of each parent is its distinguished state
+    table[-1] = np.eye(m)[-1]
+    parameters.append(table.ravel())
+  y.setParameters(parameters, rng.dirichlet(np.ones(m)))
+  if not noisy:
+    expanded = Node('Y')
+    expanded.addOutcomes(y.getOutcomes())
+    for parent in parents:
+      Arc(parent, expanded)
+    expanded.setProbabilities(y.getProbabilities())
+    y = expanded
+  z = Node('Z')
+  z.addOutcomes(['a', 'b'])
+  Arc(y, z)
+  z.setProbabilities(rng.dirichlet(np.ones(2), size=m).ravel())
+  network.addNodes(parents+[y, z])
+  return network
+
+
+def BruteForceBeliefs(network, evidence={}):
+  """Beliefs of all nodes from the full joint distribution
+
+  :Args:
+    - network (Network): Small Bayesian network
+    - evidence (dict): Number of the observed stage, starting with 1, for the names of the observed nodes
+
+  :Returns:
+    - beliefs (list): Beliefs of the nodes in the order of the network
+  """
+  nodes = network.nodes
+  index = dict((str(node), i) for i, node in enumerate(nodes))
+  card = [node.getSize() for node in nodes]
+  letters = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ'
+  operands = []
+  for i, node in enumerate(nodes):
+    axes = [index[connection[0]] for connection in node.getArcConnection()]+[i]
+    operands.append(np.reshape(np.asarray(node.getProbabilities(), dtype=float), [card[j] for j in axes]))
+    operands.append(''.join(letters[j] for j in axes))
+  joint = np.einsum(','.join(operands[1::2])+'->'+letters[:len(nodes)], *operands[::2])
+  for name, value in evidence.items():
+    mask = np.zeros(card[index[name]])
+    mask[value-1] = 1
+    joint = joint*np.reshape(mask, [card[j] if j == index[name] else 1 for j in range(len(nodes))])
+  joint = joint/np.sum(joint)
+  return [np.sum(joint, axis=tuple(j for j in range(len(nodes)) if j != i)) for i in range(len(nodes))]
+
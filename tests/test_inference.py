@@ -0,0 +1,83 @@
+#!/usr/bin/python -tt
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pytest
+from pybn import *
+from networks import *
+
+EVIDENCE = [{}, {'N11': 1}, {'N11': 2, 'N4': 1}, {'N7': 2, 'N2': 2, 'N9': 1}]
+
+def AssertBeliefs(beliefs, expected, atol=1e-10):
+  assert len(beliefs) == len(expected)
+  for p, q in zip(beliefs, expected):
+    np.testing.assert_allclose(p, q, atol=atol)
+
+
+@pytest.mark.parametrize('evidence', EVIDENCE)
+def test_variable_elimination(evidence):
+  network = RandomNetwork(12, seed=1)
+  for name, value in evidence.items():
+    network.setEvidence(name, value)
+  network.computeBeliefs()
+  AssertBeliefs(network.getBeliefs(), BruteForceBeliefs(network, evidence))
+
+
+@pytest.mark.parametrize('evidence', EVIDENCE)
+def test_junction_tree(evidence):
+  network = RandomNetwork(12, card=3, seed=2)
+  network.compile()
+  for name, value in evidence.items():
+    network.setEvidence(name, value)
+  network.computeBeliefs()
+  AssertBeliefs(network.getBeliefs(), BruteForceBeliefs(network, evidence))
+
+
+def test_incremental_evidence():
+  network = RandomNetwork(12, seed=3)
+  network.compile()
+  network.addEvidence('N11', 2)
+  network.addEvidence('N3', 1)
+  AssertBeliefs(network.getBeliefs(), BruteForceBeliefs(network, {'N11': 2, 'N3': 1}))
+  network.retractEvidence('N11')
+  AssertBeliefs(network.getBeliefs(), BruteForceBeliefs(network, {'N3': 1}))
+
+
+def test_query():
+  network = RandomNetwork(10, seed=4)
+  network.setEvidence('N9', 1)
+  joint = BruteForceBeliefs(network, {'N9': 1})
+  marginal = network.query(['N5'])
+  np.testing.assert_allclose(marginal.val, joint[5], atol=1e-10)
+
+
+def test_batch():
+  network = RandomNetwork(10, seed=5)
+  network.compile()
+  cases = np.array([[1, 0], [2, 1], [0, 2]])
+  beliefs = network.computeBeliefsBatch(cases, ['N9', 'N4'])
+  for k, case in enumerate(cases):
+    evidence = dict((name, value) for name, value in zip(['N9', 'N4'], case) if value > 0)
+    AssertBeliefs([b[k] for b in beliefs], BruteForceBeliefs(network, evidence))
+
+
+def test_memory_limit():
+  network = RandomNetwork(30, k=4, seed=6)
+  network.setMemoryLimit(8)
+  with pytest.raises(FactorSizeError):
+    network.computeBeliefs()
+  network.setMemoryLimit(8, fallback=lambda network: network.estimateBeliefs(samples=1000, seed=0))
+  network.computeBeliefs()
+  assert network.getErrors() is not None
+
+
+def test_factor_product():
+  rng = np.random.default_rng(7)
+  A = Factor()
+  A.input([3, 1, 4], [2, 3, 2], rng.random(12))
+  B = Factor()
+  B.input([4, 5], [2, 3], rng.random(6))
+  C = FactorProduct(A, B)
+  assert list(C.var) == [1, 3, 4, 5] and list(C.card) == [3, 2, 2, 3]
+  expected = np.einsum('bad,de->abde', np.reshape(A.val, [2, 3, 2], order='F'), np.reshape(B.val, [2, 3], order='F'))
+  np.testing.assert_allclose(C.val, np.ravel(expected, order='F'))
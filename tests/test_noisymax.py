@@ -0,0 +1,51 @@
+#!/usr/bin/python -tt
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pytest
+from pybn import *
+from networks import *
+
+@pytest.mark.parametrize('evidence', [{}, {'Z': 1}, {'Y': 2}, {'Z': 2, 'P1': 1}])
+@pytest.mark.parametrize('compiled', [False, True])
+def test_beliefs(evidence, compiled):
+  network = NoisyNetwork(4)
+  if compiled:
+    network.compile()
+  for name, value in evidence.items():
+    network.setEvidence(name, value)
+  network.computeBeliefs()
+  expanded = NoisyNetwork(4, noisy=False)
+  for p, q in zip(network.getBeliefs(), BruteForceBeliefs(expanded, evidence)):
+    np.testing.assert_allclose(p, q, atol=1e-10)
+
+
+def test_table():
+  y = NoisyNetwork(3).getNode('Y')
+  table = np.reshape(y.getProbabilities(), (2, 3, 2, 3))
+  np.testing.assert_allclose(np.sum(table, axis=-1), 1)
+  # With all parents in their distinguished state only the leak acts
+  np.testing.assert_allclose(table[-1, -1, -1], y.getLeak())
+
+
+def test_noisy_or():
+  a = Node('A')
+  a.addOutcomes(['t', 'f'])
+  b = Node('B')
+  b.addOutcomes(['t', 'f'])
+  o = NoisyMaxNode('O')
+  o.addOutcomes(['yes', 'no'])
+  Arc(a, o)
+  Arc(b, o)
+  o.setNoisyOr([0.9, 0.8], 0.1)
+  np.testing.assert_allclose(o.getProbabilities(), [0.982, 0.018, 0.91, 0.09, 0.82, 0.18, 0.1, 0.9])
+
+
+def test_many_parents():
+  # The full table of Y would have 2^31 entries
+  network = NoisyNetwork(30, m=2)
+  network.compile()
+  network.setEvidence('Z', 1)
+  network.computeBeliefs()
+  for beliefs in network.getBeliefs():
+    np.testing.assert_allclose(np.sum(beliefs), 1)
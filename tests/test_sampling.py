@@ -0,0 +1,68 @@
+#!/usr/bin/python -tt
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pytest
+from pybn import *
+from networks import *
+
+EVIDENCE = {'N11': 1, 'N6': 2}
+
+@pytest.mark.parametrize('method,options', [
+  ('likelihoodweighting', {}),
+  ('ais', {}),
+  ('gibbs', {'processes': 1}),
+  ])
+def test_accuracy(method, options):
+  network = RandomNetwork(12, seed=10)
+  for name, value in EVIDENCE.items():
+    network.setEvidence(name, value)
+  network.estimateBeliefs(samples=40000, method=method, seed=0, **options)
+  for p, q in zip(network.getBeliefs(), BruteForceBeliefs(network, EVIDENCE)):
+    np.testing.assert_allclose(p, q, atol=0.02)
+
+
+def test_errors():
+  # The estimated standard errors cover the deviation from the exact beliefs
+  network = RandomNetwork(12, seed=11)
+  network.setEvidence('N11', 2)
+  network.estimateBeliefs(samples=20000, seed=1)
+  exact = BruteForceBeliefs(network, {'N11': 2})
+  for p, q, e in zip(network.getBeliefs(), exact, network.getErrors()):
+    assert np.all(np.abs(p-q) <= 5*e+1e-12)
+
+
+def test_effective_sample_size():
+  # E is only "y" if all causes are on, so few samples carry the weight
+  network = Network('ess')
+  causes = []
+  for i in range(13):
+    cause = Node('C'+str(i))
+    cause.addOutcomes(['on', 'off'])
+    cause.setProbabilities([0.3, 0.7])
+    causes.append(cause)
+  d = Node('D')
+  d.addOutcomes(['a', 'b'])
+  d.setProbabilities([0.5, 0.5])
+  e = Node('E')
+  e.addOutcomes(['y', 'n'])
+  for cause in causes:
+    Arc(cause, e)
+  table = np.tile([0.0, 1.0], 2**13)
+  table[:2] = [1.0, 0.0]
+  e.setProbabilities(table)
+  network.addNodes(causes+[d, e])
+  network.setEvidence('E', 'y')
+  for seed in (2, 3):
+    network.estimateBeliefs(samples=200000, method='ais', seed=seed)
+    assert network.getDiagnostics()['ess'] >= 100
+    np.testing.assert_allclose(network.getBeliefs(['D'])[0], [0.5, 0.5], atol=0.1)
+
+
+def test_fit():
+  network = RandomNetwork(8, seed=12)
+  data = np.concatenate(list(network.sample(20000, seed=3)))
+  model = RandomNetwork(8, seed=12)
+  model.fit(data, prior=1)
+  for node, estimate in zip(network.nodes, model.nodes):
+    np.testing.assert_allclose(estimate.getProbabilities(), node.getProbabilities(), atol=0.1)
@@ -0,0 +1,78 @@
+#!/usr/bin/python -tt
+# -*- coding: utf-8 -*-
+
+import os
+import random
+import numpy as np
+from pybn import *
+from networks import *
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+def AssertSameNetwork(network, other):
+  assert [str(node) for node in network.nodes] == [str(node) for node in other.nodes]
+  for node, copy in zip(network.nodes, other.nodes):
+    assert node.getOutcomes() == copy.getOutcomes()
+    assert [c[0] for c in node.getArcConnection()] == [c[0] for c in copy.getArcConnection()]
+    np.testing.assert_allclose(node.getProbabilities(), copy.getProbabilities())
+
+
+def ShuffledNetwork():
+  """Random network whose children are added before their parents"""
+  nodes = list(RandomNetwork(15, seed=8).nodes)
+  random.Random(1).shuffle(nodes)
+  network = Network('shuffled')
+  for node in nodes:
+    node.network = None
+  y = NoisyMaxNode('Y')
+  y.addOutcomes(['a', 'b'])
+  Arc(nodes[3], y)
+  Arc(nodes[0], y)
+  y.setNoisyOr([0.7, 0.4], 0.1)
+  network.addNodes([y]+nodes)
+  return network
+
+
+def test_xdsl(tmp_path):
+  filename = os.path.join(ROOT, 'CarProblem.xdsl')
+  network = ReadXdsl(filename)
+  network.writeFile(str(tmp_path/'car.xdsl'))
+  with open(filename) as f, open(str(tmp_path/'car.xdsl')) as g:
+    assert f.read() == g.read()
+
+
+def test_xdsl_shuffled(tmp_path):
+  network = ShuffledNetwork()
+  network.writeFile(str(tmp_path/'shuffled.xdsl'))
+  copy = ReadXdsl(str(tmp_path/'shuffled.xdsl'))
+  assert set(str(node) for node in copy.nodes) == set(str(node) for node in network.nodes)
+  network.computeBeliefs()
+  copy.computeBeliefs()
+  beliefs = dict((str(node), b) for node, b in zip(copy.nodes, copy.getBeliefs()))
+  for node, b in zip(network.nodes, network.getBeliefs()):
+    np.testing.assert_allclose(b, beliefs[str(node)], atol=1e-12)
+
+
+def test_binary(tmp_path):
+  network = ShuffledNetwork()
+  network.save(str(tmp_path/'shuffled'))
+  copy = load(str(tmp_path/'shuffled'))
+  AssertSameNetwork(network, copy)
+  network.setEvidence('N14', 1)
+  copy.setEvidence('N14', 1)
+  network.computeBeliefs()
+  copy.computeBeliefs()
+  for p, q in zip(network.getBeliefs(), copy.getBeliefs()):
+    np.testing.assert_allclose(p, q, atol=1e-12)
+
+
+def test_binary_shared_tables(tmp_path):
+  network = RandomNetwork(20, card=3, seed=9)
+  network.save(str(tmp_path/'random'))
+  copy = load(str(tmp_path/'random'))
+  compiled = copy.compileArrays()
+  np.testing.assert_array_equal(compiled.values, CompileNetwork(network).values)
+  for i, node in enumerate(copy.nodes):
+    # The compiled network and the factors use the mapped tables
+    assert np.shares_memory(compiled.getCpt(i), node.getProbabilities())
+    assert np.shares_memory(compiled.getFactors()[i].val, node.getFactor().val)